@@ -5,15 +5,36 @@ Wrapper FastAPI autour du code existant main.py
 from fastapi import FastAPI, UploadFile, File, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import StreamingResponse
+from fastapi.responses import Response, StreamingResponse
+from fastapi.websockets import WebSocketState
+from pydantic import BaseModel, Field
 import asyncio
+import contextlib
+import functools
+import io
 import json
-import uuid
+import os
+import secrets
+import shutil
+import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import time
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
 import threading
 import logging
+import aiofiles
+from cachetools import TTLCache
+from PIL import Image
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# Les modules core/ (lourds) restent importés à l'initialisation, en arrière-plan
+sys.path.append('.')
 
 # Configuration du logging
 logging.basicConfig(level=logging.INFO)
@@ -47,8 +68,19 @@ app.add_middleware(
 )
 
 # Variables globales
+UPLOAD_CHUNK_SIZE = 1 << 20  # 1 MiB
+SESSION_TTL = 3600  # Une session est oubliée 1h après son dernier changement d'état
+SESSION_MAX = 10_000
+SESSION_SWEEP_INTERVAL = 60
+SERVER_START_TIME = time.time()
+MAX_CONCURRENT_ANALYSES = int(os.getenv("MAX_CONCURRENT_ANALYSES", "1"))
+analysis_semaphore = None  # Créé au démarrage, dans la boucle d'événements du serveur
 retino_app = None
-analysis_sessions = {}  # Stockage temporaire des analyses
+# Un seul worker : les appels Gemma (chargement + inférence) se partagent le GPU
+gemma_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="gemma")
+analysis_sessions = TTLCache(maxsize=SESSION_MAX, ttl=SESSION_TTL)  # Stockage temporaire des analyses
+# Compteurs mis à jour à la fin de chaque analyse
+session_metrics = {"completed": 0, "positive": 0, "errors": 0, "time_sum": 0.0}
 initialization_status = {
     "status": "starting",
     "modules": {
@@ -57,38 +89,168 @@ initialization_status = {
         "face_handler": {"status": "waiting", "progress": 0},
         "visualizer": {"status": "waiting", "progress": 0}
     },
-    "overall_progress": 0
+    "overall_progress": 0,
+    "version": 0
 }
 
+# Snapshots sérialisés du statut, reconstruits uniquement après une transition
+_status_version = 0
+_status_cache: Dict[str, Tuple[int, bytes]] = {}
+
+def _status_changed():
+    """À appeler après toute modification de initialization_status"""
+    global _status_version
+    _status_version += 1
+    # Le client compare les versions pour ignorer un snapshot /api/status périmé
+    initialization_status["version"] = _status_version
+
+def _cached_status(key: str, build) -> bytes:
+    """Retourne le snapshot `key` sérialisé, reconstruit si le statut a changé"""
+    cached = _status_cache.get(key)
+    if cached is None or cached[0] != _status_version:
+        cached = (_status_version, _dumps(build()))
+        _status_cache[key] = cached
+    return cached[1]
+
+def _build_system_status() -> dict:
+    return {
+        "status": initialization_status["status"],
+        "ready": initialization_status["status"] == "ready",
+        "overall_progress": initialization_status["overall_progress"],
+        "modules": initialization_status["modules"],
+        "app_ready": retino_app is not None,
+        "version": _status_version
+    }
+
+def _build_modules_status() -> dict:
+    return {
+        "modules": initialization_status["modules"],
+        "initializing": initialization_status["status"] not in ["ready", "error"],
+        "overall_progress": initialization_status["overall_progress"]
+    }
+
+def _dumps(message: dict) -> bytes:
+    """Sérialise un message WebSocket en UTF-8 (orjson si disponible)"""
+    if ORJSON_AVAILABLE:
+        # Les résultats d'analyse contiennent des scalaires numpy (np.float64...)
+        return orjson.dumps(message, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False).encode()
+
+def _batch_frame(frames: List[bytes]) -> bytes:
+    """Regroupe des frames déjà sérialisées en un seul message"""
+    return b'{"type":"batch","events":[' + b",".join(frames) + b']}'
+
 class WebSocketManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
+    def __init__(self, coalesce_delay: float = 0.02, send_timeout: float = 0.5,
+                 queue_size: int = 64):
+        # websocket -> (file d'envoi bornée, tâche d'écriture dédiée)
+        self.active_connections: Dict[WebSocket, Tuple[asyncio.Queue, asyncio.Task]] = {}
+        # Un client saturé ne doit pas bloquer la diffusion aux autres
+        self.send_timeout = send_timeout
+        self.queue_size = queue_size
+        # Regroupement des messages émis en rafale (initialisation)
+        self.coalesce_delay = coalesce_delay
+        self._pending: List[bytes] = []
+        self._flush_task = None
     
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
-        self.active_connections.append(websocket)
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        writer = asyncio.create_task(self._writer(websocket, queue))
+        self.active_connections[websocket] = (queue, writer)
         logger.info(f"WebSocket connected. Total connections: {len(self.active_connections)}")
     
     def disconnect(self, websocket: WebSocket):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
+        entry = self.active_connections.pop(websocket, None)
+        if entry is not None and entry[1] is not asyncio.current_task():
+            entry[1].cancel()
         logger.info(f"WebSocket disconnected. Total connections: {len(self.active_connections)}")
     
     async def broadcast(self, message: dict):
-        disconnected = []
-        for connection in self.active_connections:
+        # Sérialiser une seule fois pour tous les clients
+        self._enqueue(_dumps(message))
+    
+    def queue(self, message: dict):
+        """Met un message en attente : ceux émis dans la même fenêtre partent en une seule frame"""
+        # Sérialisé immédiatement pour figer l'état (initialization_status est mutable)
+        self._pending.append(_dumps(message))
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_after(self.coalesce_delay))
+    
+    async def _flush_after(self, delay: float):
+        await asyncio.sleep(delay)
+        await self.flush()
+    
+    async def flush(self):
+        """Envoie immédiatement les messages en attente"""
+        events, self._pending = self._pending, []
+        if not events:
+            return
+        self._enqueue(events[0] if len(events) == 1 else _batch_frame(events))
+    
+    def _enqueue(self, payload: bytes):
+        """Dépose la frame dans la file de chaque client sans attendre l'envoi"""
+        saturated = []
+        for websocket, (queue, _) in self.active_connections.items():
             try:
-                await connection.send_text(json.dumps(message))
-            except Exception as e:
-                logger.error(f"WebSocket broadcast error: {e}")
-                disconnected.append(connection)
+                queue.put_nowait(payload)
+            except asyncio.QueueFull:
+                saturated.append(websocket)
         
-        # Nettoyer les connexions fermées
-        for conn in disconnected:
-            self.active_connections.remove(conn)
+        for websocket in saturated:
+            logger.warning("WebSocket client too slow, dropping connection")
+            self._drop(websocket)
+    
+    async def _writer(self, websocket: WebSocket, queue: asyncio.Queue):
+        """Vide la file d'un client ; les frames accumulées partent en un seul message"""
+        try:
+            while True:
+                frames = [await queue.get()]
+                while not queue.empty():
+                    frames.append(queue.get_nowait())
+                
+                frame = frames[0] if len(frames) == 1 else _batch_frame(frames)
+                # Frame binaire : le JSON est déjà en UTF-8, pas de ré-encodage
+                await asyncio.wait_for(websocket.send_bytes(frame), self.send_timeout)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"WebSocket send failed, dropping client: {e!r}")
+            self._drop(websocket)
+    
+    def _drop(self, websocket: WebSocket):
+        """Retire un client défaillant et ferme sa connexion"""
+        self.disconnect(websocket)
+        if websocket.client_state == WebSocketState.CONNECTED:
+            asyncio.create_task(self._close(websocket))
+    
+    @staticmethod
+    async def _close(websocket: WebSocket):
+        with contextlib.suppress(Exception):
+            await websocket.close(code=1013)
 
 ws_manager = WebSocketManager()
 
+# Modules chargés en parallèle pendant le chargement de Gemma
+CORE_MODULE_LABELS = {
+    "eye_detector": "Eye Detector",
+    "face_handler": "Face Handler",
+    "visualizer": "Visualizer"
+}
+
+def _build_core_module(name: str):
+    """Importe et instancie un module core (exécuté dans un thread)"""
+    if name == "eye_detector":
+        from core.eye_detector_v2 import EyeDetectorV2
+        return EyeDetectorV2()
+    if name == "face_handler":
+        from core.face_handler_v2 import FaceHandlerV2
+        return FaceHandlerV2()
+    if name == "visualizer":
+        from core.visualization_v2 import VisualizationV2
+        return VisualizationV2()
+    raise ValueError(f"Unknown core module: {name}")
+
 async def initialize_retino_app():
     """Initialise l'application RetinoblastoGemma de manière asynchrone"""
     global retino_app, initialization_status
@@ -100,12 +262,7 @@ async def initialize_retino_app():
         print("\n🤖 STARTING REAL GEMMA 3N INITIALIZATION")
         print("="*60)
         
-        # Importer le module main réel
-        import sys
-        sys.path.append('.')
-        from main import RetinoblastoGemmaV6
-        
-        # Créer une instance réelle (pas Tkinter)
+        # Instance headless : n'importe pas main.py, donc ni tkinter ni fenêtre Tk
         class HeadlessRetinoblastoGemma:
             def __init__(self):
                 self.eye_detector = None
@@ -120,122 +277,75 @@ async def initialize_retino_app():
                     initialization_status["overall_progress"] = 0
                     
                     # Diffuser l'état initial
-                    await ws_manager.broadcast({
+                    _status_changed()
+                    ws_manager.queue({
                         "type": "initialization_progress",
                         "status": initialization_status,
                         "message": "Starting system initialization..."
                     })
                     
-                    # 1. Eye Detector (25%)
-                    print("🔄 Loading Eye Detector...")
-                    initialization_status["modules"]["eye_detector"]["status"] = "loading"
-                    initialization_status["overall_progress"] = 10
-                    await ws_manager.broadcast({
-                        "type": "initialization_progress",
-                        "status": initialization_status,
-                        "message": "Loading Eye Detector..."
-                    })
-                    
-                    from core.eye_detector_v2 import EyeDetectorV2
-                    self.eye_detector = EyeDetectorV2()
-                    initialization_status["modules"]["eye_detector"]["status"] = "ready"
-                    initialization_status["overall_progress"] = 25
-                    print("✅ Eye Detector loaded")
-                    
-                    await ws_manager.broadcast({
-                        "type": "initialization_progress",
-                        "status": initialization_status,
-                        "message": "Eye Detector ready"
-                    })
-                    
-                    # 2. Face Handler (50%)
-                    print("🔄 Loading Face Handler...")
-                    initialization_status["modules"]["face_handler"]["status"] = "loading"
-                    initialization_status["overall_progress"] = 35
-                    await ws_manager.broadcast({
-                        "type": "initialization_progress",
-                        "status": initialization_status,
-                        "message": "Loading Face Handler..."
-                    })
-                    
-                    from core.face_handler_v2 import FaceHandlerV2
-                    self.face_handler = FaceHandlerV2()
-                    initialization_status["modules"]["face_handler"]["status"] = "ready"
-                    initialization_status["overall_progress"] = 50
-                    print("✅ Face Handler loaded")
-                    
-                    await ws_manager.broadcast({
-                        "type": "initialization_progress",
-                        "status": initialization_status,
-                        "message": "Face Handler ready"
-                    })
-                    
-                    # 3. Visualizer (65%)
-                    print("🔄 Loading Visualizer...")
-                    initialization_status["modules"]["visualizer"]["status"] = "loading"
-                    initialization_status["overall_progress"] = 55
-                    await ws_manager.broadcast({
-                        "type": "initialization_progress",
-                        "status": initialization_status,
-                        "message": "Loading Visualizer..."
-                    })
-                    
-                    from core.visualization_v2 import VisualizationV2
-                    self.visualizer = VisualizationV2()
-                    initialization_status["modules"]["visualizer"]["status"] = "ready"
-                    initialization_status["overall_progress"] = 65
-                    print("✅ Visualizer loaded")
-                    
-                    await ws_manager.broadcast({
-                        "type": "initialization_progress",
-                        "status": initialization_status,
-                        "message": "Visualizer ready"
-                    })
-                    
-                    # 4. GEMMA 3N - LE PLUS CRITIQUE (65% -> 100%)
-                    print("🔄 Loading Gemma 3n - This will take 3-5 minutes...")
-                    initialization_status["modules"]["gemma"]["status"] = "loading"
-                    initialization_status["overall_progress"] = 70
-                    await ws_manager.broadcast({
-                        "type": "initialization_progress",
-                        "status": initialization_status,
-                        "message": "🤖 Loading Gemma 3n model - this may take 3-5 minutes..."
-                    })
-                    
+                    # 0. Lancer le chargement de Gemma 3n (3-5 minutes) dans un thread
+                    # dès maintenant : les autres modules se chargent pendant ce temps
+                    print("🔄 Loading Gemma 3n in background - This will take 3-5 minutes...")
                     from core.gemma_handler_v2 import GemmaHandlerV2
                     self.gemma_handler = GemmaHandlerV2()
+                    initialization_status["modules"]["gemma"]["status"] = "loading"
                     
-                    # Diffuser pendant le chargement de Gemma
-                    await ws_manager.broadcast({
+                    loop = asyncio.get_running_loop()
+                    gemma_future = loop.run_in_executor(
+                        gemma_executor, self.gemma_handler.initialize_local_model
+                    )
+                    
+                    # 1-3. Eye Detector, Face Handler, Visualizer (10% -> 65%)
+                    # Imports et constructeurs en parallèle dans des threads
+                    print("🔄 Loading Eye Detector, Face Handler and Visualizer...")
+                    for name in CORE_MODULE_LABELS:
+                        initialization_status["modules"][name]["status"] = "loading"
+                    initialization_status["overall_progress"] = 10
+                    _status_changed()
+                    ws_manager.queue({
                         "type": "initialization_progress",
                         "status": initialization_status,
-                        "message": "🤖 Initializing Gemma 3n model weights..."
+                        "message": "Loading Eye Detector, Face Handler and Visualizer..."
                     })
                     
-                    # VRAIE CHARGEMENT DU MODÈLE (bloquant)
-                    print("🤖 Starting Gemma 3n local model loading...")
+                    async def load(name):
+                        return name, await loop.run_in_executor(None, _build_core_module, name)
                     
-                    # Utiliser run_in_executor pour ne pas bloquer
-                    import asyncio
-                    loop = asyncio.get_event_loop()
+                    progress_steps = iter([25, 50, 65])
+                    for loaded in asyncio.as_completed([load(name) for name in CORE_MODULE_LABELS]):
+                        name, module = await loaded
+                        setattr(self, name, module)
+                        initialization_status["modules"][name]["status"] = "ready"
+                        initialization_status["overall_progress"] = next(progress_steps)
+                        print(f"✅ {CORE_MODULE_LABELS[name]} loaded")
+                        
+                        _status_changed()
+                        ws_manager.queue({
+                            "type": "initialization_progress",
+                            "status": initialization_status,
+                            "message": f"{CORE_MODULE_LABELS[name]} ready"
+                        })
                     
+                    # 4. GEMMA 3N - LE PLUS CRITIQUE (65% -> 100%)
+                    print("🔄 Waiting for Gemma 3n weights...")
                     initialization_status["overall_progress"] = 75
-                    await ws_manager.broadcast({
+                    _status_changed()
+                    ws_manager.queue({
                         "type": "initialization_progress",
                         "status": initialization_status,
                         "message": "🤖 Loading Gemma 3n weights (3-5 minutes)..."
                     })
                     
-                    gemma_success = await loop.run_in_executor(
-                        None, self.gemma_handler.initialize_local_model
-                    )
+                    gemma_success = await gemma_future
                     
                     if gemma_success:
                         initialization_status["modules"]["gemma"]["status"] = "ready"
                         initialization_status["overall_progress"] = 100
                         print("✅ Gemma 3n REALLY loaded and ready!")
                         
-                        await ws_manager.broadcast({
+                        _status_changed()
+                        ws_manager.queue({
                             "type": "initialization_progress",
                             "status": initialization_status,
                             "message": "✅ Gemma 3n model loaded successfully!"
@@ -247,7 +357,8 @@ async def initialize_retino_app():
                     print(f"❌ Module initialization error: {e}")
                     initialization_status["status"] = "error"
                     initialization_status["error"] = str(e)
-                    await ws_manager.broadcast({
+                    _status_changed()
+                    ws_manager.queue({
                         "type": "initialization_error",
                         "status": initialization_status,
                         "error": str(e)
@@ -263,7 +374,8 @@ async def initialize_retino_app():
         initialization_status["status"] = "ready"
         initialization_status["overall_progress"] = 100
         
-        await ws_manager.broadcast({
+        _status_changed()
+        ws_manager.queue({
             "type": "initialization_complete",
             "status": initialization_status,
             "message": "All modules loaded successfully!"
@@ -278,39 +390,84 @@ async def initialize_retino_app():
         initialization_status["status"] = "error"
         initialization_status["error"] = str(e)
         
-        await ws_manager.broadcast({
+        _status_changed()
+        ws_manager.queue({
             "type": "initialization_error",
             "status": initialization_status,
             "error": str(e)
         })
 
+def _remove_orphan_uploads(live_sessions: frozenset, cutoff: float) -> int:
+    """Supprime les uploads dont la session a expiré (exécuté hors boucle)
+    
+    Seuls les fichiers <session_id>.bin / .json sont concernés : les anciens
+    uploads <uuid>_<nom de fichier> ne sont jamais supprimés.
+    """
+    removed = 0
+    with os.scandir("uploads") as entries:
+        for entry in entries:
+            # <session_id>.bin (image) et <session_id>.json (métadonnées)
+            session_id, ext = os.path.splitext(entry.name)
+            if ext not in (".bin", ".json") or "_" in session_id:
+                continue
+            if (entry.is_file() and session_id not in live_sessions
+                    and entry.stat().st_mtime < cutoff):
+                try:
+                    os.remove(entry.path)
+                    removed += 1
+                except OSError as e:
+                    logger.warning(f"Could not remove orphan upload {entry.name}: {e}")
+    return removed
+
+async def sweep_expired_sessions():
+    """Purge périodique des sessions expirées et des fichiers associés"""
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(SESSION_SWEEP_INTERVAL)
+        try:
+            analysis_sessions.expire()
+            removed = await loop.run_in_executor(
+                None, _remove_orphan_uploads,
+                frozenset(analysis_sessions.keys()), time.time() - SESSION_TTL
+            )
+            if removed:
+                logger.info(f"🧹 Removed {removed} expired upload(s)")
+        except Exception as e:
+            logger.error(f"Session sweep failed: {e}")
+
 @app.on_event("startup")
 async def startup_event():
     """Démarrage de l'application"""
+    global analysis_semaphore
     logger.info("🚀 FastAPI server starting...")
     
+    analysis_semaphore = asyncio.Semaphore(MAX_CONCURRENT_ANALYSES)
+    
     # Créer les dossiers nécessaires
     Path("uploads").mkdir(exist_ok=True)
     Path("results").mkdir(exist_ok=True)
     
     # Lancer l'initialisation en arrière-plan
     asyncio.create_task(initialize_retino_app())
+    asyncio.create_task(sweep_expired_sessions())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Arrêt de l'application : sauvegarde explicite du suivi facial"""
+    face_handler = getattr(retino_app, "face_handler", None)
+    if face_handler is not None:
+        face_handler.cleanup()
 
 @app.websocket("/ws/progress")
 async def websocket_endpoint(websocket: WebSocket):
     await ws_manager.connect(websocket)
     try:
-        # Envoyer le statut initial
-        await websocket.send_text(json.dumps({
-            "type": "status_update",
-            "status": initialization_status
-        }))
+        # Pas de snapshot initial : le client lit /api/status (mis en cache) à l'ouverture
         
-        # Maintenir la connexion
+        # Maintenir la connexion : le keepalive est assuré par les frames
+        # PING/PONG du protocole (ws_ping_interval), on attend juste la fermeture
         while True:
-            await asyncio.sleep(1)
-            # Envoyer un ping pour maintenir la connexion
-            await websocket.send_text(json.dumps({"type": "ping"}))
+            await websocket.receive_text()
             
     except WebSocketDisconnect:
         ws_manager.disconnect(websocket)
@@ -321,60 +478,90 @@ async def websocket_endpoint(websocket: WebSocket):
 @app.get("/api/status")
 async def get_system_status():
     """Statut général du système"""
-    return {
-        "status": initialization_status["status"],
-        "ready": initialization_status["status"] == "ready",
-        "overall_progress": initialization_status["overall_progress"],
-        "modules": initialization_status["modules"],
-        "app_ready": retino_app is not None
-    }
+    return Response(content=_cached_status("system", _build_system_status),
+                    media_type="application/json")
 
 @app.get("/api/modules-status") 
 async def get_modules_status():
     """Statut détaillé des modules"""
-    return {
-        "modules": initialization_status["modules"],
-        "initializing": initialization_status["status"] not in ["ready", "error"],
-        "overall_progress": initialization_status["overall_progress"]
-    }
+    return Response(content=_cached_status("modules", _build_modules_status),
+                    media_type="application/json")
+
+def _persist_upload(source, dest_path: Path) -> int:
+    """Copie le fichier uploadé sur le disque et retourne sa taille (exécuté hors boucle)"""
+    source.seek(0)
+    with open(dest_path, "wb") as dest:
+        shutil.copyfileobj(source, dest, UPLOAD_CHUNK_SIZE)
+        return dest.tell()
+
+# Signatures des formats lus par OpenCV/PIL dans le pipeline d'analyse
+IMAGE_SIGNATURES = (
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"BM", "bmp"),
+    (b"II*\x00", "tiff"),
+    (b"MM\x00*", "tiff"),
+)
+
+def _sniff_image_format(head: bytes) -> Optional[str]:
+    """Identifie le format d'image à partir des premiers octets"""
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    for signature, image_format in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return image_format
+    return None
+
+def _probe_image(head: bytes) -> Tuple[str, str]:
+    """Dimensions et format lus dans l'en-tête seul (aucun décodage des pixels)"""
+    try:
+        with Image.open(io.BytesIO(head)) as img:
+            return f"{img.width}x{img.height}", img.format
+    except Exception:
+        return "unknown", "unknown"
 
 @app.post("/api/upload-image")
 async def upload_image(file: UploadFile = File(...)):
     """Upload et sauvegarde d'une image médicale"""
     try:
-        # Vérifier le type de fichier
-        if not file.content_type.startswith('image/'):
-            raise HTTPException(status_code=400, detail="File must be an image")
+        # Premier bloc conservé : il contient l'en-tête JPEG/PNG
+        head = await file.read(UPLOAD_CHUNK_SIZE)
+        
+        # Vérifier le type de fichier d'après sa signature (Content-Type non fiable)
+        if _sniff_image_format(head) is None:
+            raise HTTPException(status_code=400, detail="File must be a JPEG, PNG, WebP, BMP or TIFF image")
         
         # Créer un ID unique pour cette session
-        session_id = str(uuid.uuid4())
+        session_id = secrets.token_hex(12)
         
-        # Sauvegarder l'image
+        # Sauvegarder l'image : le nom fourni par le client ne touche jamais le disque
         upload_dir = Path("uploads")
-        file_path = upload_dir / f"{session_id}_{file.filename}"
+        file_path = upload_dir / f"{session_id}.bin"
         
-        with open(file_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
+        # Copie vers le disque et lecture de l'en-tête, en parallèle hors de la boucle
+        loop = asyncio.get_running_loop()
+        size, (dimensions, image_format) = await asyncio.gather(
+            loop.run_in_executor(None, _persist_upload, file.file, file_path),
+            loop.run_in_executor(None, _probe_image, head)
+        )
         
-        # Obtenir les infos de l'image
-        try:
-            from PIL import Image
-            img = Image.open(file_path)
-            image_info = {
-                "filename": file.filename,
-                "dimensions": f"{img.width}x{img.height}",
-                "size": len(content),
-                "format": img.format
-            }
-            img.close()
-        except Exception as e:
-            image_info = {
-                "filename": file.filename,
-                "dimensions": "unknown",
-                "size": len(content),
-                "format": "unknown"
-            }
+        image_info = {
+            "filename": file.filename,
+            "dimensions": dimensions,
+            "size": size,
+            "format": image_format
+        }
+        
+        # Métadonnées à côté de l'image (uploads/<session_id>.json)
+        async with aiofiles.open(upload_dir / f"{session_id}.json", "wb") as sidecar:
+            await sidecar.write(_dumps({**image_info, "content_type": file.content_type}))
+        
+        # Mémoriser le chemin : l'analyse le retrouve sans parcourir uploads/
+        analysis_sessions[session_id] = {
+            "status": "uploaded",
+            "file_path": str(file_path),
+            "filename": file.filename
+        }
         
         # Mettre à jour l'application si prête
         if retino_app:
@@ -390,12 +577,20 @@ async def upload_image(file: UploadFile = File(...)):
             "status": "uploaded"
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Upload failed: {e}")
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
+class AnalysisSettings(BaseModel):
+    """Paramètres d'analyse envoyés par l'interface web (validés une fois à l'entrée)"""
+    confidence_threshold: float = Field(0.5, ge=0.0, le=1.0)
+    face_tracking: bool = True
+    enhanced_detection: bool = True
+
 @app.post("/api/analyze/{session_id}")
-async def start_analysis(session_id: str, settings: dict = None):
+async def start_analysis(session_id: str, settings: Optional[AnalysisSettings] = None):
     """Lance l'analyse RÉELLE de rétinoblastome"""
     try:
         logger.info(f"🔍 REAL Analysis request for session: {session_id}")
@@ -406,14 +601,22 @@ async def start_analysis(session_id: str, settings: dict = None):
         if not retino_app:
             raise HTTPException(status_code=400, detail="Application not initialized")
         
+        session = analysis_sessions.get(session_id)
+        if session is None:
+            raise HTTPException(status_code=404, detail="Session not found - upload an image first")
+        
         # Lancer l'analyse RÉELLE en arrière-plan
-        analysis_task = asyncio.create_task(run_REAL_analysis_async(session_id, settings or {}))
-        analysis_sessions[session_id] = {
+        analysis_task = asyncio.create_task(
+            run_REAL_analysis_async(session_id, session, settings or AnalysisSettings())
+        )
+        session.update({
             "status": "running",
             "progress": 0,
             "task": analysis_task,
             "start_time": time.time()
-        }
+        })
+        # Réinsérer la session : le TTL du cache court depuis l'insertion, pas depuis update()
+        analysis_sessions[session_id] = session
         
         logger.info(f"✅ REAL Analysis started for session: {session_id}")
         
@@ -423,23 +626,42 @@ async def start_analysis(session_id: str, settings: dict = None):
             "message": "REAL Analysis started with Gemma 3n"
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"REAL Analysis failed to start: {e}")
         raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
 
 
-async def run_REAL_analysis_async(session_id: str, settings: dict):
+async def run_REAL_analysis_async(session_id: str, session: Dict, settings: AnalysisSettings):
+    """Exécute l'analyse RÉELLE, au plus MAX_CONCURRENT_ANALYSES à la fois"""
+    if analysis_semaphore.locked():
+        await ws_manager.broadcast({
+            "type": "analysis_progress",
+            "session_id": session_id,
+            "progress": 0,
+            "message": "Waiting for a previous analysis to finish..."
+        })
+    
+    # Le GPU (3 GB sur GTX 1650) ne supporte pas plusieurs analyses simultanées
+    async with analysis_semaphore:
+        await _run_REAL_analysis(session_id, session, settings)
+
+async def _run_REAL_analysis(session_id: str, session: Dict, settings: AnalysisSettings):
     """Exécute l'analyse RÉELLE avec les vrais modules"""
     try:
         global retino_app
         
-        # 1. Récupérer le chemin de l'image - CORRIGÉ
-        import glob
-        image_files = glob.glob(f"uploads/{session_id}_*")
-        if not image_files:
+        # Début effectif (après l'attente du sémaphore) : le TTL repart de maintenant
+        analysis_sessions[session_id] = session
+        
+        # 1. Récupérer le chemin de l'image enregistré à l'upload
+        if "file_path" not in session:
             raise Exception(f"No image found for session {session_id}")
         
-        image_path = image_files[0]  # Prendre le premier fichier trouvé
+        image_path = session["file_path"]
+        if not os.path.exists(image_path):
+            raise Exception(f"Image file missing for session {session_id}")
         
         await ws_manager.broadcast({
             "type": "analysis_progress", 
@@ -448,9 +670,13 @@ async def run_REAL_analysis_async(session_id: str, settings: dict):
             "message": "Loading image with real eye detector..."
         })
         
-        # 2. VRAIE détection des yeux
-        detection_results = retino_app.eye_detector.detect_eyes_and_faces(
-            image_path, enhanced_mode=settings.get('enhanced_detection', True)
+        # 2. VRAIE détection des yeux (CPU intensif : hors de la boucle d'événements)
+        loop = asyncio.get_running_loop()
+        detection_results = await loop.run_in_executor(
+            None, functools.partial(
+                retino_app.eye_detector.detect_eyes_and_faces,
+                image_path, enhanced_mode=settings.enhanced_detection
+            )
         )
         
         await ws_manager.broadcast({
@@ -462,9 +688,22 @@ async def run_REAL_analysis_async(session_id: str, settings: dict):
         
         # 3. VRAIE analyse avec Gemma 3n
         if retino_app.gemma_handler and retino_app.gemma_handler.is_ready():
-            analysis_results = retino_app.gemma_handler.analyze_eye_regions(
-                detection_results['regions'],
-                confidence_threshold=settings.get('confidence_threshold', 0.5)
+            def on_region_done(done: int, total: int):
+                # Appelé depuis le thread Gemma : progression réelle 40% -> 80%
+                loop.call_soon_threadsafe(ws_manager.queue, {
+                    "type": "analysis_progress",
+                    "session_id": session_id,
+                    "progress": 40 + (40 * done) // total,
+                    "message": f"Gemma 3n analyzed region {done}/{total}"
+                })
+            
+            analysis_results = await loop.run_in_executor(
+                gemma_executor, functools.partial(
+                    retino_app.gemma_handler.analyze_eye_regions,
+                    detection_results['regions'],
+                    confidence_threshold=settings.confidence_threshold,
+                    progress_callback=on_region_done
+                )
             )
         else:
             # Fallback si Gemma pas prêt
@@ -491,12 +730,20 @@ async def run_REAL_analysis_async(session_id: str, settings: dict):
         })
         
         # 4. Finaliser
-        analysis_sessions[session_id] = {
+        completed_time = time.time()
+        session.update({
             "status": "completed",
             "progress": 100,
             "results": analysis_results,
-            "completed_time": time.time()
-        }
+            "completed_time": completed_time
+        })
+        analysis_sessions[session_id] = session
+        
+        # Métriques incrémentales (pas de parcours des sessions à chaque requête)
+        session_metrics["completed"] += 1
+        session_metrics["time_sum"] += completed_time - session.get("start_time", completed_time)
+        if any(r.get('leukocoria_detected') for r in analysis_results.get('results', [])):
+            session_metrics["positive"] += 1
         
         await ws_manager.broadcast({
             "type": "analysis_complete",
@@ -509,107 +756,15 @@ async def run_REAL_analysis_async(session_id: str, settings: dict):
         
     except Exception as e:
         logger.error(f"❌ REAL Analysis error: {e}")
-        await ws_manager.broadcast({
-            "type": "analysis_error",
-            "session_id": session_id,
-            "error": str(e)
-        })
-
-async def run_analysis_async(session_id: str, settings: dict):
-    """Exécute l'analyse en arrière-plan avec WebSocket updates"""
-    try:
-        # Broadcaster le début
-        await ws_manager.broadcast({
-            "type": "analysis_progress", 
-            "session_id": session_id,
-            "progress": 0,
-            "message": "Starting retinoblastoma analysis..."
-        })
+        session_metrics["errors"] += 1
+        session.update({"status": "error", "error": str(e)})
+        analysis_sessions[session_id] = session
         
-        # Simulation progressive de l'analyse
-        steps = [
-            (10, "Loading image..."),
-            (25, "Detecting eye regions..."),
-            (40, "Processing with Gemma 3n AI..."),
-            (70, "Analyzing for leukocoria..."),
-            (85, "Generating medical report..."),
-            (95, "Finalizing results...")
-        ]
-        
-        for progress, message in steps:
-            await ws_manager.broadcast({
-                "type": "analysis_progress",
-                "session_id": session_id, 
-                "progress": progress,
-                "message": message
-            })
-            await asyncio.sleep(1)
-        
-        # Simuler le résultat de l'analyse
-        result = {
-            "session_id": session_id,
-            "total_regions": 2,
-            "positive_detections": 0,
-            "analysis_method": "gemma3n_local",
-            "processing_time": 5.2,
-            "results": [
-                {
-                    "region_id": 0,
-                    "region_type": "left_eye",
-                    "leukocoria_detected": False,
-                    "confidence": 92.5,
-                    "risk_level": "low",
-                    "medical_reasoning": "Normal dark pupil appearance with no signs of leukocoria. Healthy retinal reflex observed.",
-                    "recommendations": "Continue routine pediatric eye monitoring",
-                    "urgency": "routine"
-                },
-                {
-                    "region_id": 1,
-                    "region_type": "right_eye",
-                    "leukocoria_detected": False,
-                    "confidence": 89.8,
-                    "risk_level": "low", 
-                    "medical_reasoning": "Normal dark pupil appearance with no signs of leukocoria. Healthy retinal reflex observed.",
-                    "recommendations": "Continue routine pediatric eye monitoring",
-                    "urgency": "routine"
-                }
-            ],
-            "summary": {
-                "overall_risk": "low",
-                "recommendation": "No signs of retinoblastoma detected. Continue regular pediatric eye examinations.",
-                "next_screening": "6 months"
-            }
-        }
-        
-        # Broadcaster les résultats
-        await ws_manager.broadcast({
-            "type": "analysis_complete",
-            "session_id": session_id,
-            "progress": 100,
-            "results": result
-        })
-        
-        analysis_sessions[session_id] = {
-            "status": "completed",
-            "progress": 100,
-            "results": result,
-            "completed_time": time.time()
-        }
-        
-        logger.info(f"Analysis completed for session: {session_id}")
-        
-    except Exception as e:
-        logger.error(f"Analysis error for session {session_id}: {e}")
         await ws_manager.broadcast({
             "type": "analysis_error",
             "session_id": session_id,
             "error": str(e)
         })
-        
-        analysis_sessions[session_id] = {
-            "status": "error",
-            "error": str(e)
-        }
 
 @app.get("/api/results/{session_id}")
 async def get_analysis_results(session_id: str):
@@ -629,15 +784,14 @@ async def get_analysis_results(session_id: str):
 @app.get("/api/metrics")
 async def get_session_metrics():
     """Métriques de la session"""
-    completed_sessions = [s for s in analysis_sessions.values() if s["status"] == "completed"]
-    positive_sessions = [s for s in completed_sessions if s.get("results", {}).get("positive_detections", 0) > 0]
+    completed = session_metrics["completed"]
     
     return {
-        "total_analyses": len(completed_sessions),
-        "positive_detections": len(positive_sessions),
-        "average_processing_time": 4.2,  # Simulé
-        "errors": len([s for s in analysis_sessions.values() if s["status"] == "error"]),
-        "session_start": time.time() - 3600  # Il y a 1h
+        "total_analyses": completed,
+        "positive_detections": session_metrics["positive"],
+        "average_processing_time": session_metrics["time_sum"] / completed if completed else 0.0,
+        "errors": session_metrics["errors"],
+        "session_start": SERVER_START_TIME
     }
 
 # Servir les fichiers statiques de l'interface web (si construite)
@@ -646,5 +800,28 @@ if web_dist_path.exists():
     app.mount("/", StaticFiles(directory=str(web_dist_path), html=True), name="web")
 
 if __name__ == "__main__":
+    import importlib.util
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8001, log_level="info")
\ No newline at end of file
+    
+    # uvloop n'est pas disponible sous Windows : repli sur la boucle asyncio
+    event_loop = "uvloop" if importlib.util.find_spec("uvloop") else "asyncio"
+    # Parseur HTTP en C si installé (uvicorn[standard]), sinon h11 en pur Python
+    http_impl = "httptools" if importlib.util.find_spec("httptools") else "h11"
+    
+    uvicorn.run(
+        app,
+        host="0.0.0.0",
+        port=8001,
+        loop=event_loop,
+        http=http_impl,
+        ws="websockets",
+        ws_ping_interval=20,
+        ws_ping_timeout=20,
+        # Compression permessage-deflate des frames de progression (JSON répétitif)
+        ws_per_message_deflate=True,
+        # Pas de log d'accès : les handshakes WebSocket et le polling /api/status le saturent
+        access_log=False,
+        # Un seul worker : l'état (sessions, modèle Gemma, connexions WS) est en mémoire
+        workers=1,
+        log_level="info"
+    )
\ No newline at end of file
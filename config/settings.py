@@ -3,6 +3,8 @@ Configuration centrale pour RetinoblastoGemma v6
 Hackathon Google Gemma - Paramètres et chemins
 """
 from pathlib import Path
+from functools import lru_cache, wraps
+import copy
 import os
 
 # === CHEMINS PRINCIPAUX ===
@@ -121,6 +123,21 @@ MEDICAL_CONFIG = {
 }
 
 # === FONCTIONS UTILITAIRES ===
+def _cached_copy(func):
+    """Met en cache le résultat de func et en retourne une copie profonde à chaque appel
+    
+    Les appelants peuvent modifier le dictionnaire reçu sans altérer le cache ;
+    func.cache_clear() reste disponible pour rafraîchir.
+    """
+    cached = lru_cache(maxsize=1)(func)
+    
+    @wraps(func)
+    def wrapper():
+        return copy.deepcopy(cached())
+    
+    wrapper.cache_clear = cached.cache_clear
+    return wrapper
+
 def ensure_directories():
     """Crée tous les dossiers nécessaires"""
     directories = [
@@ -131,20 +148,32 @@ def ensure_directories():
     for directory in directories:
         directory.mkdir(parents=True, exist_ok=True)
 
+@_cached_copy
 def get_model_info():
-    """Retourne les informations sur le modèle Gemma 3n"""
+    """Retourne les informations sur le modèle Gemma 3n
+    
+    Mis en cache pour la durée du processus (get_model_info.cache_clear() pour rafraîchir)
+    """
+    # Un seul parcours du dossier ; sous Windows DirEntry.stat() ne coûte aucun appel système
+    shards = []
+    try:
+        with os.scandir(GEMMA_MODEL_PATH) as entries:
+            shards = [e for e in entries if e.name.endswith(".safetensors") and e.is_file()]
+    except FileNotFoundError:
+        pass
+    
     model_files = {
         'config': GEMMA_MODEL_PATH / "config.json",
         'tokenizer': GEMMA_MODEL_PATH / "tokenizer.json", 
-        'model_files': list(GEMMA_MODEL_PATH.glob("*.safetensors"))
+        'model_files': [GEMMA_MODEL_PATH / e.name for e in shards]
     }
     
     availability = {
         'model_directory_exists': GEMMA_MODEL_PATH.exists(),
         'config_available': model_files['config'].exists(),
         'tokenizer_available': model_files['tokenizer'].exists(),
-        'model_files_count': len(model_files['model_files']),
-        'total_model_size_gb': sum(f.stat().st_size for f in model_files['model_files']) / (1024**3) if model_files['model_files'] else 0
+        'model_files_count': len(shards),
+        'total_model_size_gb': sum(e.stat().st_size for e in shards) / (1024**3)
     }
     
     return {
@@ -153,6 +182,7 @@ def get_model_info():
         'config': GEMMA_CONFIG
     }
 
+@_cached_copy
 def get_system_requirements():
     """Retourne les exigences système recommandées"""
     return {
@@ -180,8 +210,12 @@ def get_system_requirements():
         ]
     }
 
+@_cached_copy
 def validate_environment():
-    """Valide l'environnement de développement"""
+    """Valide l'environnement de développement
+    
+    Mis en cache : l'import de torch et l'initialisation CUDA ne sont faits qu'une fois
+    """
     import sys
     
     validation_results = {
@@ -5,17 +5,56 @@ Optimisé pour le hackathon Google Gemma
 """
 import cv2
 import numpy as np
-from PIL import Image, ImageEnhance
+from PIL import Image
 import logging
 from typing import Dict, List, Tuple, Optional
 from pathlib import Path
+from collections import OrderedDict
+import hashlib
 import time
 
 logger = logging.getLogger(__name__)
 
+class EyeRegion(dict):
+    """Région oculaire dont l'image PIL n'est créée qu'au premier accès à region['image']
+    
+    Tant qu'elle n'est pas matérialisée, la région garde une vue NumPy sur l'image
+    RGB de la détection : les régions jamais analysées ne coûtent aucune copie.
+    """
+    
+    def __init__(self, rgb_view: np.ndarray, fields: Dict):
+        super().__init__(fields)
+        self._rgb_view = rgb_view
+    
+    def __missing__(self, key):
+        if key == 'image' and self._rgb_view is not None:
+            image = Image.fromarray(np.ascontiguousarray(self._rgb_view))
+            self['image'] = image
+            self._rgb_view = None  # Libère la référence sur le tampon RGB
+            return image
+        raise KeyError(key)
+    
+    def __contains__(self, key):
+        return super().__contains__(key) or (key == 'image' and self._rgb_view is not None)
+    
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
 class EyeDetectorV2:
     """Détecteur d'yeux optimisé pour images complètes et croppées"""
     
+    # Indices MediaPipe pour les yeux (ÉTENDUS pour plus de précision)
+    LEFT_EYE_IDX = np.array([33, 7, 163, 144, 145, 153, 154, 155, 133, 173, 157, 158, 159, 160, 161, 246,
+                             130, 25, 110, 24, 23, 22, 26, 112, 243, 190, 56, 28, 27, 29, 30], dtype=np.intp)
+    RIGHT_EYE_IDX = np.array([362, 382, 381, 380, 374, 373, 390, 249, 263, 466, 388, 387, 386, 385, 384, 398,
+                              359, 255, 339, 254, 253, 252, 256, 341, 463, 414, 286, 258, 257, 259, 260], dtype=np.intp)
+    
+    # Noyau SMOOTH de PIL (celui qu'utilise ImageEnhance.Sharpness)
+    SMOOTH_KERNEL = np.array([[1, 1, 1], [1, 5, 1], [1, 1, 1]], dtype=np.float32) / 13
+    
     def __init__(self):
         self.mp_face_mesh = None
         self.face_mesh = None
@@ -34,15 +73,21 @@ class EyeDetectorV2:
             'max_num_faces': 5,
             'enable_image_enhancement': True,
             'cropped_threshold_ratio': 2.0,  # Si width/height < 2, considérer comme image croppée
+            'landmark_cache_size': 64,  # Résultats FaceMesh conservés (LRU par contenu d'image)
+            'max_inference_side': 1024,  # FaceMesh redimensionne en interne : inutile de lui passer plus
+            'reduced_decode_side': 2000,  # Au-delà, les images cropped sont décodées en résolution réduite
         }
         
+        # Cache LRU des landmarks FaceMesh : empreinte de l'image -> landmarks normalisés par visage
+        self._landmark_cache: "OrderedDict[bytes, List[np.ndarray]]" = OrderedDict()
+        
         # Métriques
         self.detection_stats = {
             'total_detections': 0,
             'successful_detections': 0,
             'full_face_detections': 0,
             'cropped_detections': 0,
-            'processing_times': []
+            'processing_time_sum': 0.0  # Cumul : la moyenne se calcule en O(1)
         }
         
         # Initialiser MediaPipe
@@ -86,30 +131,53 @@ class EyeDetectorV2:
         start_time = time.time()
         
         try:
-            # Charger et analyser l'image
-            image = cv2.imread(image_path)
-            if image is None:
-                raise ValueError(f"Cannot load image: {image_path}")
-            
-            h, w, _ = image.shape
+            # Lire uniquement l'en-tête pour connaître les dimensions
+            w, h = self._read_image_size(image_path)
             aspect_ratio = w / h
             
-            # Déterminer le mode de détection
+            # Déterminer le mode de détection avant de décoder les pixels
             detection_mode = self._determine_detection_mode(w, h, aspect_ratio)
             
             logger.info(f"Image {w}x{h}, ratio {aspect_ratio:.2f}, mode: {detection_mode}")
             
-            # Préprocessing si activé
-            if enhanced_mode and self.config['enable_image_enhancement']:
-                image = self._enhance_image_quality(image)
+            # Les grandes images cropped sont coupées en deux puis redimensionnées :
+            # libjpeg peut les décoder directement à 1/2 ou 1/4 de la résolution
+            decode_flag = cv2.IMREAD_COLOR
+            if detection_mode == 'cropped_eye' and max(w, h) > self.config['reduced_decode_side']:
+                if max(w, h) > 2 * self.config['reduced_decode_side']:
+                    decode_flag = cv2.IMREAD_REDUCED_COLOR_4
+                else:
+                    decode_flag = cv2.IMREAD_REDUCED_COLOR_2
             
-            # Détection selon le mode
-            if detection_mode == 'full_face':
-                results = self._detect_full_face_mode(image, image_path)
-            elif detection_mode == 'cropped_eye':
-                results = self._detect_cropped_mode(image, image_path)
-            else:  # mixed
-                results = self._detect_mixed_mode(image, image_path)
+            image = cv2.imread(image_path, decode_flag)
+            if image is None:
+                raise ValueError(f"Cannot load image: {image_path}")
+            
+            # Préprocessing si activé. Les crops d'images croppées partent tels quels
+            # vers Gemma : on les améliore d'emblée. Avec un visage, MediaPipe s'en
+            # sort seul sur une photo correcte : l'amélioration ne sert qu'en 2e essai
+            enhance = enhanced_mode and self.config['enable_image_enhancement']
+            enhancement_applied = False
+            if enhance and detection_mode == 'cropped_eye':
+                enhanced = self._enhance_image_quality(image)
+                enhancement_applied = enhanced is not image
+                image = enhanced
+                enhance = False
+            
+            results = self._run_detection_mode(image, image_path, detection_mode)
+            
+            if enhance and self.initialized and results.get('faces_detected', 0) == 0:
+                enhanced = self._enhance_image_quality(image)
+                # Image déjà bien exposée : relancer la détection ne changerait rien
+                if enhanced is not image:
+                    logger.info("No face found on raw image, retrying with enhancement")
+                    image = enhanced
+                    enhancement_applied = True
+                    results = self._run_detection_mode(image, image_path, detection_mode)
+            
+            # Ramener les bbox dans le repère de l'image originale
+            if image.shape[1] != w or image.shape[0] != h:
+                self._rescale_regions(results['regions'], w / image.shape[1], h / image.shape[0])
             
             # Finaliser les résultats
             processing_time = time.time() - start_time
@@ -117,6 +185,7 @@ class EyeDetectorV2:
             results['detection_mode'] = detection_mode
             results['image_dimensions'] = (w, h)
             results['enhanced'] = enhanced_mode
+            results['enhancement_applied'] = enhancement_applied
             
             # Mettre à jour les statistiques
             self._update_stats(results, detection_mode, processing_time)
@@ -129,6 +198,37 @@ class EyeDetectorV2:
             logger.error(f"Detection failed: {e}")
             return self._create_empty_result(str(e))
     
+    def _read_image_size(self, image_path: str) -> Tuple[int, int]:
+        """Retourne (largeur, hauteur) en lisant seulement l'en-tête du fichier"""
+        try:
+            with Image.open(image_path) as header:
+                w, h = header.size
+                # cv2.imread applique l'orientation EXIF : rotations de 90° = dimensions inversées
+                if header.getexif().get(0x0112) in (5, 6, 7, 8):
+                    w, h = h, w
+            return w, h
+        except Exception as e:
+            raise ValueError(f"Cannot load image: {image_path} ({e})")
+    
+    def _rescale_regions(self, regions: List[Dict], scale_x: float, scale_y: float):
+        """Remet à l'échelle les bbox de régions détectées sur une image réduite"""
+        for region in regions:
+            x, y, bw, bh = region['bbox']
+            region['bbox'] = (int(x * scale_x), int(y * scale_y), int(bw * scale_x), int(bh * scale_y))
+    
+    def _run_detection_mode(self, image: np.ndarray, image_path: str, detection_mode: str) -> Dict:
+        """Lance la détection du mode choisi sur une image BGR"""
+        # Conversion RGB unique : les modes de détection travaillent dessus
+        # et les crops en sont de simples tranches
+        rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        
+        if detection_mode == 'full_face':
+            return self._detect_full_face_mode(rgb_image, image_path)
+        elif detection_mode == 'cropped_eye':
+            return self._detect_cropped_mode(rgb_image, image_path)
+        else:  # mixed
+            return self._detect_mixed_mode(rgb_image, image_path)
+    
     def _determine_detection_mode(self, width: int, height: int, aspect_ratio: float) -> str:
         """Détermine le mode de détection optimal - OPTIMISÉ DATASET 2 YEUX"""
         
@@ -147,90 +247,68 @@ class EyeDetectorV2:
         # Par défaut = cropped (car ton dataset est principalement cropped)
         return 'cropped_eye'
     
-    def _extract_eyes_from_face(self, face_landmarks, image: np.ndarray, face_idx: int) -> List[Dict]:
+    def _extract_eyes_from_face(self, face_landmarks: np.ndarray, image: np.ndarray, face_idx: int) -> List[Dict]:
         """Extrait les yeux d'un visage détecté par MediaPipe - AMÉLIORÉ"""
         h, w, _ = image.shape
         
-        # Convertir les landmarks en coordonnées
-        landmarks = []
-        for landmark in face_landmarks.landmark:
-            x = int(landmark.x * w)
-            y = int(landmark.y * h)
-            landmarks.append((x, y))
+        # Convertir les landmarks normalisés en coordonnées pixel (un seul passage vectorisé)
+        landmarks = (face_landmarks * np.array([w, h], dtype=np.float32)).astype(np.int32)
         
         eyes = []
         
-        # Indices MediaPipe pour les yeux (ÉTENDUS pour plus de précision)
-        left_eye_indices = [33, 7, 163, 144, 145, 153, 154, 155, 133, 173, 157, 158, 159, 160, 161, 246, 
-                           130, 25, 110, 24, 23, 22, 26, 112, 243, 190, 56, 28, 27, 29, 30]
-        right_eye_indices = [362, 382, 381, 380, 374, 373, 390, 249, 263, 466, 388, 387, 386, 385, 384, 398,
-                            359, 255, 339, 254, 253, 252, 256, 341, 463, 414, 286, 258, 257, 259, 260]
-        
-        # Extraire œil gauche avec validation
-        left_eye = self._extract_single_eye(
-            landmarks, left_eye_indices, image, f'left_face_{face_idx}'
-        )
-        if left_eye and self._validate_eye_region(left_eye, image):
-            eyes.append(left_eye)
-        
-        # Extraire œil droit avec validation
-        right_eye = self._extract_single_eye(
-            landmarks, right_eye_indices, image, f'right_face_{face_idx}'
-        )
-        if right_eye and self._validate_eye_region(right_eye, image):
-            eyes.append(right_eye)
+        # Extraire les deux yeux (la validation est faite en lot par l'appelant)
+        for eye_indices, side in ((self.LEFT_EYE_IDX, 'left'), (self.RIGHT_EYE_IDX, 'right')):
+            eye = self._extract_single_eye(
+                landmarks, eye_indices, image, f'{side}_face_{face_idx}'
+            )
+            if eye:
+                eyes.append(eye)
         
-        logger.info(f"Extracted {len(eyes)} valid eye regions from face {face_idx}")
         return eyes
     
-    def _validate_eye_region(self, eye_region: Dict, image: np.ndarray) -> bool:
-        """Valide qu'une région oculaire est valide"""
+    def _validate_eye_regions(self, eye_regions: List[Dict], image: np.ndarray) -> List[Dict]:
+        """Ne garde que les régions oculaires valides (tous les bbox vérifiés en un passage)"""
+        if not eye_regions:
+            return []
+        
         try:
-            bbox = eye_region.get('bbox')
-            if not bbox:
-                return False
-            
-            x, y, w, h = bbox
+            bboxes = np.array([region['bbox'] for region in eye_regions], dtype=np.float32)
+            x, y, w, h = bboxes.T
             img_h, img_w = image.shape[:2]
+            ratio = w / np.maximum(h, 1)
             
-            # Vérifications de base
-            if w < 20 or h < 15:  # Trop petit
-                return False
-            if x < 0 or y < 0 or x + w > img_w or y + h > img_h:  # Hors limites
-                return False
-            if w > img_w * 0.6 or h > img_h * 0.6:  # Trop grand
-                return False
-            
-            # Vérification du ratio
-            ratio = w / h
-            if ratio < 0.8 or ratio > 4.0:  # Ratio anormal pour un œil
-                return False
+            valid = (
+                (w >= 20) & (h >= 15)  # Trop petit
+                & (x >= 0) & (y >= 0) & (x + w <= img_w) & (y + h <= img_h)  # Hors limites
+                & (w <= img_w * 0.6) & (h <= img_h * 0.6)  # Trop grand
+                & (ratio >= 0.8) & (ratio <= 4.0)  # Ratio anormal pour un œil
+            )
             
-            return True
+            return [region for region, keep in zip(eye_regions, valid) if keep]
             
         except Exception as e:
             logger.error(f"Eye region validation failed: {e}")
-            return False
+            return []
     
     def _enhance_image_quality(self, image: np.ndarray) -> np.ndarray:
-        """Améliore la qualité de l'image pour une meilleure détection"""
+        """Améliore la qualité de l'image pour une meilleure détection
+        
+        Retourne l'image inchangée (même objet) si elle est déjà bien exposée.
+        """
         try:
-            # Conversion en PIL pour amélioration
-            pil_image = Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
-            
-            # Amélioration du contraste (important pour leucocorie)
-            enhancer = ImageEnhance.Contrast(pil_image)
-            pil_image = enhancer.enhance(1.2)
+            # Exposition et contraste déjà corrects : rien à gagner (et MediaPipe
+            # peut même y perdre), on évite le pipeline complet
+            mean, std = cv2.meanStdDev(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY))
+            if 80 < mean[0][0] < 180 and std[0][0] > 40:
+                return image
             
-            # Amélioration de la netteté
-            enhancer = ImageEnhance.Sharpness(pil_image)
-            pil_image = enhancer.enhance(1.1)
-            
-            # Reconversion
-            enhanced = cv2.cvtColor(np.array(pil_image), cv2.COLOR_RGB2BGR)
+            # Contraste (important pour leucocorie) et netteté, directement en BGR
+            enhanced = self._contrast_sharpen(image, 1.2, 1.1)
             
             # Réduction du bruit tout en préservant les détails
-            enhanced = cv2.bilateralFilter(enhanced, 9, 75, 75)
+            # (filtre récursif à transformée de domaine : coût linéaire, contrairement au bilatéral)
+            enhanced = cv2.edgePreservingFilter(enhanced, flags=cv2.RECURS_FILTER,
+                                                sigma_s=30, sigma_r=0.4)
             
             return enhanced
             
@@ -238,43 +316,91 @@ class EyeDetectorV2:
             logger.warning(f"Image enhancement failed: {e}")
             return image
     
-    def _detect_full_face_mode(self, image: np.ndarray, image_path: str) -> Dict:
-        """Détection sur visage complet avec MediaPipe"""
+    def _contrast_sharpen(self, image: np.ndarray, contrast: float, sharpness: float,
+                          is_rgb: bool = False) -> np.ndarray:
+        """Équivalent OpenCV de ImageEnhance.Contrast puis ImageEnhance.Sharpness
+        
+        Le contraste passe par une LUT de 256 entrées centrée sur la luminance
+        moyenne (comme PIL), la netteté par un masque flou avec le noyau SMOOTH.
+        """
+        c0, c1, c2, _ = cv2.mean(image)
+        r, b = (c0, c2) if is_rgb else (c2, c0)
+        mean = int(0.299 * r + 0.587 * c1 + 0.114 * b + 0.5)
+        
+        lut = np.clip(np.rint(mean + (np.arange(256) - mean) * contrast), 0, 255).astype(np.uint8)
+        enhanced = cv2.LUT(image, lut)
+        
+        smooth = cv2.filter2D(enhanced, -1, self.SMOOTH_KERNEL)
+        return cv2.addWeighted(enhanced, sharpness, smooth, 1.0 - sharpness, 0)
+    
+    def _detect_full_face_mode(self, rgb_image: np.ndarray, image_path: str) -> Dict:
+        """Détection sur visage complet avec MediaPipe (image RGB)"""
         if not self.initialized:
-            return self._fallback_detection(image, 'full_face')
+            return self._fallback_detection(rgb_image, 'full_face')
         
         try:
-            h, w, _ = image.shape
-            rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-            
-            # Détection MediaPipe
-            results = self.face_mesh.process(rgb_image)
-            
-            regions = []
-            if results.multi_face_landmarks:
-                for face_idx, face_landmarks in enumerate(results.multi_face_landmarks):
-                    # Extraire les yeux de ce visage
-                    face_eyes = self._extract_eyes_from_face(
-                        face_landmarks, image, face_idx
-                    )
-                    regions.extend(face_eyes)
+            h, w, _ = rgb_image.shape
+            
+            # Réduire les grandes photos avant l'inférence ; les landmarks étant
+            # normalisés, les crops restent extraits de l'image pleine résolution
+            inference_image = rgb_image
+            max_side = self.config['max_inference_side']
+            if max(h, w) > max_side:
+                scale = max_side / max(h, w)
+                inference_image = cv2.resize(rgb_image, None, fx=scale, fy=scale,
+                                             interpolation=cv2.INTER_AREA)
+            
+            # Détection MediaPipe (ou landmarks déjà calculés pour cette image)
+            faces = self._process_face_mesh(inference_image)
+            
+            # Extraire les yeux de chaque visage (simple indexation NumPy : vues paresseuses)
+            per_face = [self._extract_eyes_from_face(face_landmarks, rgb_image, face_idx)
+                        for face_idx, face_landmarks in enumerate(faces)]
+            candidates = [eye for face_eyes in per_face for eye in face_eyes]
+            regions = self._validate_eye_regions(candidates, rgb_image)
+            logger.info(f"Extracted {len(regions)}/{len(candidates)} valid eye regions from {len(faces)} face(s)")
             
             return {
                 'total_regions': len(regions),
                 'regions': regions,
-                'faces_detected': len(results.multi_face_landmarks) if results.multi_face_landmarks else 0,
+                'faces_detected': len(faces),
                 'method': 'mediapipe_full_face',
                 'success': True
             }
             
         except Exception as e:
             logger.error(f"Full face detection failed: {e}")
-            return self._fallback_detection(image, 'full_face')
+            return self._fallback_detection(rgb_image, 'full_face')
     
-    def _detect_cropped_mode(self, image: np.ndarray, image_path: str) -> Dict:
-        """Détection sur image croppée (un ou deux yeux)"""
+    def _process_face_mesh(self, rgb_image: np.ndarray) -> List[np.ndarray]:
+        """Exécute FaceMesh avec un cache LRU indexé par le contenu de l'image
+        
+        Seuls les landmarks normalisés sont conservés : les crops sont reconstruits
+        à partir de l'image courante, la mémoire du cache reste donc bornée.
+        """
+        key = hashlib.blake2b(rgb_image.tobytes(), digest_size=16).digest()
+        key += repr(rgb_image.shape).encode()
+        
+        cached = self._landmark_cache.get(key)
+        if cached is not None:
+            self._landmark_cache.move_to_end(key)
+            logger.debug("FaceMesh cache hit")
+            return cached
+        
+        results = self.face_mesh.process(rgb_image)
+        faces = [self._landmarks_to_array(face_landmarks)
+                 for face_landmarks in (results.multi_face_landmarks or [])]
+        
+        self._landmark_cache[key] = faces
+        if len(self._landmark_cache) > self.config['landmark_cache_size']:
+            self._landmark_cache.popitem(last=False)
+        
+        return faces
+    
+    def _detect_cropped_mode(self, rgb_image: np.ndarray, image_path: str) -> Dict:
+        """Détection sur image croppée (un ou deux yeux, image RGB)"""
         try:
-            h, w, _ = image.shape
+            h, w, _ = rgb_image.shape
             
             regions = []
             
@@ -283,10 +409,10 @@ class EyeDetectorV2:
             
             if aspect_ratio > 2.0:
                 # Image horizontale = probablement deux yeux côte à côte
-                regions = self._split_horizontal_eyes(image)
+                regions = self._split_horizontal_eyes(rgb_image)
             else:
                 # Image carrée/verticale = probablement un seul œil
-                regions = self._analyze_single_eye_region(image)
+                regions = self._analyze_single_eye_region(rgb_image)
             
             return {
                 'total_regions': len(regions),
@@ -298,13 +424,13 @@ class EyeDetectorV2:
             
         except Exception as e:
             logger.error(f"Cropped detection failed: {e}")
-            return self._fallback_detection(image, 'cropped')
+            return self._fallback_detection(rgb_image, 'cropped')
     
-    def _detect_mixed_mode(self, image: np.ndarray, image_path: str) -> Dict:
+    def _detect_mixed_mode(self, rgb_image: np.ndarray, image_path: str) -> Dict:
         """Mode mixte: essaye d'abord full face, puis cropped"""
         try:
             # Essayer d'abord le mode full face
-            full_face_result = self._detect_full_face_mode(image, image_path)
+            full_face_result = self._detect_full_face_mode(rgb_image, image_path)
             
             if full_face_result['total_regions'] > 0:
                 full_face_result['method'] = 'mixed_full_face_success'
@@ -312,67 +438,40 @@ class EyeDetectorV2:
             
             # Si échec, essayer le mode cropped
             logger.info("Full face detection failed, trying cropped mode")
-            cropped_result = self._detect_cropped_mode(image, image_path)
+            cropped_result = self._detect_cropped_mode(rgb_image, image_path)
             cropped_result['method'] = 'mixed_cropped_fallback'
             
             return cropped_result
             
         except Exception as e:
             logger.error(f"Mixed mode detection failed: {e}")
-            return self._fallback_detection(image, 'mixed')
+            return self._fallback_detection(rgb_image, 'mixed')
     
-    def _extract_eyes_from_face(self, face_landmarks, image: np.ndarray, face_idx: int) -> List[Dict]:
-        """Extrait les yeux d'un visage détecté par MediaPipe"""
-        h, w, _ = image.shape
-        
-        # Convertir les landmarks en coordonnées
-        landmarks = []
-        for landmark in face_landmarks.landmark:
-            x = int(landmark.x * w)
-            y = int(landmark.y * h)
-            landmarks.append((x, y))
-        
-        eyes = []
-        
-        # Indices MediaPipe pour les yeux
-        left_eye_indices = [33, 7, 163, 144, 145, 153, 154, 155, 133, 173, 157, 158, 159, 160, 161, 246]
-        right_eye_indices = [362, 382, 381, 380, 374, 373, 390, 249, 263, 466, 388, 387, 386, 385, 384, 398]
-        
-        # Extraire œil gauche
-        left_eye = self._extract_single_eye(
-            landmarks, left_eye_indices, image, f'left_face_{face_idx}'
-        )
-        if left_eye:
-            eyes.append(left_eye)
-        
-        # Extraire œil droit
-        right_eye = self._extract_single_eye(
-            landmarks, right_eye_indices, image, f'right_face_{face_idx}'
-        )
-        if right_eye:
-            eyes.append(right_eye)
-        
-        return eyes
+    @staticmethod
+    def _landmarks_to_array(face_landmarks) -> np.ndarray:
+        """Convertit les landmarks MediaPipe en tableau (N, 2) de coordonnées normalisées"""
+        points = face_landmarks.landmark
+        return np.fromiter(
+            (v for lm in points for v in (lm.x, lm.y)),
+            dtype=np.float32, count=2 * len(points)
+        ).reshape(-1, 2)
     
-    def _extract_single_eye(self, landmarks: List[Tuple[int, int]], 
-                          eye_indices: List[int], image: np.ndarray, 
+    def _extract_single_eye(self, landmarks: np.ndarray, 
+                          eye_indices: np.ndarray, image: np.ndarray, 
                           eye_id: str) -> Optional[Dict]:
-        """Extrait une région oculaire spécifique"""
+        """Extrait une région oculaire spécifique d'une image RGB"""
         try:
             h, w, _ = image.shape
             
             # Obtenir les points de l'œil
-            eye_points = [landmarks[i] for i in eye_indices if i < len(landmarks)]
+            eye_points = landmarks[eye_indices[eye_indices < len(landmarks)]]
             
             if len(eye_points) < 8:
                 return None
             
             # Calculer la boîte englobante
-            xs = [p[0] for p in eye_points]
-            ys = [p[1] for p in eye_points]
-            
-            x_min, x_max = min(xs), max(xs)
-            y_min, y_max = min(ys), max(ys)
+            x_min, y_min = eye_points.min(axis=0).tolist()
+            x_max, y_max = eye_points.max(axis=0).tolist()
             
             # Ajouter une marge
             margin = 30
@@ -384,26 +483,22 @@ class EyeDetectorV2:
             if x2 <= x1 or y2 <= y1:
                 return None
             
-            # Extraire la région
-            eye_region = image[y1:y2, x1:x2]
-            eye_pil = Image.fromarray(cv2.cvtColor(eye_region, cv2.COLOR_BGR2RGB))
-            
-            return {
+            # Extraire la région (l'image est déjà en RGB, l'image PIL est créée à la demande)
+            return EyeRegion(image[y1:y2, x1:x2], {
                 'id': eye_id,
                 'type': eye_id.split('_')[0],  # 'left' ou 'right'
                 'bbox': (x1, y1, x2 - x1, y2 - y1),
-                'image': eye_pil,
                 'landmarks': eye_points,
                 'confidence': 0.9,
                 'source': 'mediapipe_face_detection'
-            }
+            })
             
         except Exception as e:
             logger.error(f"Single eye extraction failed: {e}")
             return None
     
     def _split_horizontal_eyes(self, image: np.ndarray) -> List[Dict]:
-        """Divise une image horizontale en deux régions oculaires"""
+        """Divise une image RGB horizontale en deux régions oculaires"""
         try:
             h, w, _ = image.shape
             mid_x = w // 2
@@ -413,30 +508,26 @@ class EyeDetectorV2:
             # Œil gauche (première moitié)
             left_region = image[:, :mid_x]
             if left_region.size > 0:
-                left_pil = Image.fromarray(cv2.cvtColor(left_region, cv2.COLOR_BGR2RGB))
-                regions.append({
+                regions.append(EyeRegion(left_region, {
                     'id': 'left_cropped',
                     'type': 'left',
                     'bbox': (0, 0, mid_x, h),
-                    'image': left_pil,
                     'landmarks': [],
                     'confidence': 0.7,
                     'source': 'horizontal_split'
-                })
+                }))
             
             # Œil droit (seconde moitié)
             right_region = image[:, mid_x:]
             if right_region.size > 0:
-                right_pil = Image.fromarray(cv2.cvtColor(right_region, cv2.COLOR_BGR2RGB))
-                regions.append({
+                regions.append(EyeRegion(right_region, {
                     'id': 'right_cropped',
                     'type': 'right',
                     'bbox': (mid_x, 0, w - mid_x, h),
-                    'image': right_pil,
                     'landmarks': [],
                     'confidence': 0.7,
                     'source': 'horizontal_split'
-                })
+                }))
             
             return regions
             
@@ -456,29 +547,25 @@ class EyeDetectorV2:
 
             # ŒIL GAUCHE (première moitié de l'image)
             left_region = image[:, :mid_x]
-            left_pil = Image.fromarray(cv2.cvtColor(left_region, cv2.COLOR_BGR2RGB))
-            regions.append({
+            regions.append(EyeRegion(left_region, {
                 'id': 'left_eye_crop',
                 'type': 'left',
                 'bbox': (0, 0, mid_x, h),
-                'image': left_pil,
                 'landmarks': [],
                 'confidence': 0.9,  # Confiance élevée car on sait qu'il y a 2 yeux
                 'source': 'dataset_dual_eye_split'
-            })
+            }))
 
             # ŒIL DROIT (seconde moitié de l'image)
             right_region = image[:, mid_x:]
-            right_pil = Image.fromarray(cv2.cvtColor(right_region, cv2.COLOR_BGR2RGB))
-            regions.append({
+            regions.append(EyeRegion(right_region, {
                 'id': 'right_eye_crop',
                 'type': 'right',
                 'bbox': (mid_x, 0, w - mid_x, h),
-                'image': right_pil,
                 'landmarks': [],
                 'confidence': 0.9,  # Confiance élevée car on sait qu'il y a 2 yeux
                 'source': 'dataset_dual_eye_split'
-            })
+            }))
 
             logger.info(f"Dataset mode: Force split into 2 eyes - Left: {mid_x}x{h}, Right: {w-mid_x}x{h}")
             return regions
@@ -487,56 +574,22 @@ class EyeDetectorV2:
             logger.error(f"Dataset dual eye analysis failed: {e}")
             return []
     
-    def _guess_eye_type(self, image: np.ndarray) -> str:
-        """Essaie de deviner si c'est un œil gauche ou droit"""
-        # Analyse basique - peut être améliorée
-        try:
-            h, w, _ = image.shape
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-            
-            # Chercher la position probable de la pupille
-            circles = cv2.HoughCircles(
-                gray, cv2.HOUGH_GRADIENT, 1, 20,
-                param1=50, param2=30, minRadius=5, maxRadius=min(w, h)//4
-            )
-            
-            if circles is not None:
-                circles = np.round(circles[0, :]).astype("int")
-                if len(circles) > 0:
-                    # Prendre le cercle le plus central
-                    center_x = circles[0][0]
-                    
-                    # Si la pupille est vers la gauche de l'image, c'est probablement l'œil droit
-                    # (car on regarde depuis le point de vue de la personne)
-                    if center_x < w * 0.4:
-                        return 'right'
-                    elif center_x > w * 0.6:
-                        return 'left'
-            
-            return 'center'  # Par défaut
-            
-        except Exception:
-            return 'center'
-    
     def _fallback_detection(self, image: np.ndarray, mode: str) -> Dict:
-        """Détection de fallback sans MediaPipe"""
+        """Détection de fallback sans MediaPipe (image RGB)"""
         try:
             logger.warning(f"Using fallback detection for mode: {mode}")
             
             h, w, _ = image.shape
             
-            # Créer une région basique couvrant l'image entière
-            eye_pil = Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
-            
-            fallback_region = {
+            # Créer une région basique couvrant l'image entière (déjà en RGB)
+            fallback_region = EyeRegion(image, {
                 'id': 'fallback_region',
                 'type': 'unknown',
                 'bbox': (0, 0, w, h),
-                'image': eye_pil,
                 'landmarks': [],
                 'confidence': 0.3,
                 'source': f'fallback_{mode}'
-            }
+            })
             
             return {
                 'total_regions': 1,
@@ -564,7 +617,7 @@ class EyeDetectorV2:
     def _update_stats(self, results: Dict, detection_mode: str, processing_time: float):
         """Met à jour les statistiques de détection"""
         self.detection_stats['total_detections'] += 1
-        self.detection_stats['processing_times'].append(processing_time)
+        self.detection_stats['processing_time_sum'] += processing_time
         
         if results['success'] and results['total_regions'] > 0:
             self.detection_stats['successful_detections'] += 1
@@ -581,7 +634,7 @@ class EyeDetectorV2:
             return self.detection_stats
         
         success_rate = (self.detection_stats['successful_detections'] / total) * 100
-        avg_time = sum(self.detection_stats['processing_times']) / len(self.detection_stats['processing_times'])
+        avg_time = self.detection_stats['processing_time_sum'] / total
         
         return {
             **self.detection_stats,
@@ -596,24 +649,26 @@ class EyeDetectorV2:
             'successful_detections': 0,
             'full_face_detections': 0,
             'cropped_detections': 0,
-            'processing_times': []
+            'processing_time_sum': 0.0  # Cumul : la moyenne se calcule en O(1)
         }
+        self._landmark_cache.clear()
     
     def enhance_eye_region(self, eye_image: Image.Image) -> Image.Image:
         """Améliore une région oculaire pour l'analyse"""
         try:
-            # Redimensionner à une taille standard
-            enhanced = eye_image.resize((224, 224), Image.Resampling.LANCZOS)
-            
-            # Amélioration du contraste pour la leucocorie
-            enhancer = ImageEnhance.Contrast(enhanced)
-            enhanced = enhancer.enhance(1.3)
+            # Redimensionner à une taille standard : INTER_AREA pour réduire,
+            # LANCZOS seulement quand il faut agrandir
+            w, h = eye_image.size
+            if w >= 224 and h >= 224:
+                resized = cv2.resize(np.asarray(eye_image.convert('RGB')), (224, 224),
+                                     interpolation=cv2.INTER_AREA)
+            else:
+                resized = np.asarray(eye_image.convert('RGB').resize((224, 224), Image.Resampling.LANCZOS))
             
-            # Amélioration de la netteté
-            enhancer = ImageEnhance.Sharpness(enhanced)
-            enhanced = enhancer.enhance(1.2)
+            # Contraste (leucocorie) puis netteté, via LUT et masque flou
+            enhanced = self._contrast_sharpen(resized, 1.3, 1.2, is_rgb=True)
             
-            return enhanced
+            return Image.fromarray(enhanced)
             
         except Exception as e:
             logger.error(f"Eye region enhancement failed: {e}")
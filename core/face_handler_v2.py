@@ -6,37 +6,165 @@ Optimisé pour le hackathon Google Gemma
 import numpy as np
 import logging
 import json
+import os
 import pickle
+import copy
 from pathlib import Path
-from typing import Dict, List, Tuple, Optional
+from collections import deque
+from itertools import islice
+from bisect import bisect_right
+from typing import Dict, Iterable, List, Tuple, Optional
 from datetime import datetime
+from dataclasses import dataclass
 import time
 
 logger = logging.getLogger(__name__)
 
+# FAISS (optionnel) : recherche du visage le plus proche pour les grandes bases
+try:
+    import faiss
+    FAISS_AVAILABLE = True
+except ImportError:
+    FAISS_AVAILABLE = False
+
+# blosc2 (optionnel) : matrice des encodages compressée sur disque
+try:
+    import blosc2
+    BLOSC2_AVAILABLE = True
+except ImportError:
+    BLOSC2_AVAILABLE = False
+
+# orjson (optionnel) : sérialisation JSON en C pour les sauvegardes et rapports
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+def _dumps(obj, indent: bool = True) -> bytes:
+    """Sérialise en JSON UTF-8 (orjson si disponible)"""
+    if ORJSON_AVAILABLE:
+        option = orjson.OPT_SERIALIZE_NUMPY | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(obj, default=str, option=option)
+    return json.dumps(obj, indent=2 if indent else None, default=str).encode('utf-8')
+
+# Seuils de confiance (low | medium/soon | medium/urgent | high), assouplis avec historique
+_RISK_THRESHOLDS = (45, 65, 85)
+_RISK_THRESHOLDS_HISTORY = (45, 55, 75)
+# Palier -> code de _RISK_OUTCOMES pour une détection positive
+_DETECTED_OUTCOME_CODES = (4, 3, 2, 1)
+
+def _risk_outcome_code(confidence: float, detected: bool,
+                       has_history_adjustment: bool, adjustment_factor: float) -> int:
+    """Cascade de seuils du niveau de risque réduite à un code entier (index de _RISK_OUTCOMES)"""
+    # Seuils ajustés pour les cas avec historique : palier trouvé par dichotomie
+    if detected:
+        thresholds = _RISK_THRESHOLDS_HISTORY if has_history_adjustment else _RISK_THRESHOLDS
+        return _DETECTED_OUTCOME_CODES[bisect_right(thresholds, confidence)]
+    # Même pour les non-détectés, vérifier si confiance ajustée suggère surveillance
+    if has_history_adjustment and confidence > 30:
+        return 5
+    if has_history_adjustment and adjustment_factor > 0.1:
+        # Fort ajustement même sans détection = surveillance renforcée
+        return 6
+    return 0
+
+# Code -> (risk_level, urgency, suffixe de medical_reasoning, recommendation_note) ;
+# None : champ inchangé (code 0 : aucun changement)
+_RISK_OUTCOMES = (
+    None,
+    ('high', 'immediate', " High confidence with patient history support.", None),
+    ('medium', 'urgent', " Moderate confidence enhanced by patient history.", None),
+    ('medium', 'soon', None, None),
+    ('low', 'routine', None, None),
+    ('low', 'soon', None, 'Continue close monitoring due to patient history'),
+    (None, 'soon', None, 'Enhanced monitoring recommended based on patient history'),
+)
+
+@dataclass
+class _Adjustment:
+    """Ajustement calculé pour un résultat, avant application (interne à adjust_confidence_with_history)"""
+    __slots__ = ('original_confidence', 'original_detected', 'factor', 'reasoning')
+    original_confidence: float
+    original_detected: bool
+    factor: float
+    reasoning: List[str]
+
+class _TimestampView:
+    """Vue en lecture seule des horodatages d'un historique, pour bisect"""
+    __slots__ = ('history',)
+    
+    def __init__(self, history):
+        self.history = history
+    
+    def __len__(self):
+        return len(self.history)
+    
+    def __getitem__(self, index):
+        return self.history[index].get('timestamp', 0)
+
 class FaceHandlerV2:
     """Gestionnaire de reconnaissance faciale pour suivi longitudinal"""
     
+    # Précision de stockage des encodages (mémoire et fichier des encodages)
+    ENCODING_DTYPE = np.float16
+    # Lignes converties en float32 à la fois pendant la recherche NumPy
+    SEARCH_BLOCK_ROWS = 4096
+    
     def __init__(self):
         self.face_recognition_available = False
         self.known_faces = {}  # face_id -> face_data
-        self.analysis_history = {}  # face_id -> [analyses]
+        self.analysis_history = {}  # face_id -> deque(analyses), bornée à max_history_per_face
+        self._positive_counts: Dict[str, int] = {}  # face_id -> analyses positives dans l'historique
+        self._summary_cache: Dict[str, Dict] = {}  # face_id -> résumé, invalidé à chaque modification du visage
+        self._faces_version = 0  # Incrémenté à chaque modification d'un visage (ajout, reconnaissance, analyse)
+        self._tracked_faces_cache: Optional[Tuple[int, float, List[Dict]]] = None  # (version, horodatage, liste triée)
+        self._history_stats_cache: Dict[str, Tuple[int, Optional[Dict]]] = {}  # face_id -> (analyses récentes, tendances)
         self.next_face_id = 1
         
+        # Matrice contiguë des encodages connus : ligne i <-> _enc_ids[i]
+        # (seul endroit où sont conservés les encodages, known_faces ne garde que les métadonnées)
+        # Stockée en float16 (256 octets/visage) ; les distances sont calculées en float32
+        self._enc_matrix = np.empty((0, 128), dtype=self.ENCODING_DTYPE)
+        self._enc_buffer: Optional[np.ndarray] = None  # Réserve dont _enc_matrix est une vue (ajouts en O(1) amorti)
+        self._enc_ids: List[str] = []
+        self._enc_saved_rows = 0  # Lignes déjà présentes dans le fichier des encodages
+        # Index FAISS stocké lui aussi en float16 : pas de seconde copie float32 de la base
+        self._faiss_index = (faiss.IndexScalarQuantizer(128, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_L2)
+                             if FAISS_AVAILABLE else None)
+        
         # Chemins de sauvegarde
         self.data_dir = Path("data/face_tracking")
         self.data_dir.mkdir(parents=True, exist_ok=True)
-        self.faces_db_path = self.data_dir / "known_faces.pkl"
-        self.history_path = self.data_dir / "analysis_history.json"
+        self.faces_db_path = self.data_dir / "known_faces.pkl"  # Ancien format, migré au chargement
+        # Encodages compressés (blosc2/ZSTD) si disponible, sinon .npy brut mappé en mémoire
+        self.npy_encodings_path = self.data_dir / "encodings.npy"
+        self.b2_encodings_path = self.data_dir / "encodings.b2nd"
+        self.encodings_path = self.b2_encodings_path if BLOSC2_AVAILABLE else self.npy_encodings_path
+        self.faces_meta_path = self.data_dir / "known_faces.json"
+        self.history_path = self.data_dir / "analysis_history.json"  # Ancien format, migré au chargement
+        self.history_log_path = self.data_dir / "analysis_history.ndjson"  # Journal en ajout seul
+        self.history_orphans_path = self.data_dir / "analysis_history.orphans.ndjson"  # Lignes sans visage connu
         
         # Configuration
         self.config = {
             'similarity_threshold': 0.6,
             'max_history_per_face': 10,
             'confidence_boost_factor': 1.2,  # Boost de confiance pour analyses répétées
-            'enable_persistence': True
+            'enable_persistence': True,
+            'save_interval': 30.0,  # Secondes minimum entre deux sauvegardes automatiques
+            'tracked_faces_ttl': 5.0,  # Durée de vie maximale de la liste triée des visages suivis
+            'faiss_min_faces': 1000  # En dessous, le produit NumPy est plus rapide que FAISS
         }
         
+        # Seuil de correspondance sur la distance L2 au carré (évite la racine carrée)
+        self._threshold_sq = (1 - self.config['similarity_threshold']) ** 2
+        
+        # Sauvegarde différée : les données modifiées sont écrites au plus toutes
+        # les save_interval secondes, et toujours à save_data()/cleanup()
+        self._dirty = False
+        self._last_save = time.time()
+        
         # Statistiques
         self.stats = {
             'total_faces_processed': 0,
@@ -51,6 +179,7 @@ class FaceHandlerV2:
         # Charger les données existantes
         if self.config['enable_persistence']:
             self._load_data()
+        self._rebuild_positive_counts()
     
     def _initialize_face_recognition(self):
         """Initialise la reconnaissance faciale avec gestion d'erreurs"""
@@ -96,28 +225,42 @@ class FaceHandlerV2:
                 logger.info("Face recognition not available, using basic tracking")
                 return self._basic_face_tracking(detection_results, tracking_results)
             
-            # Traiter chaque région détectée
-            for region in detection_results.get('regions', []):
-                face_result = self._process_single_region(image_path, region)
-                
-                if face_result:
-                    region_id = region['id']
-                    tracking_results['face_mappings'][region_id] = face_result['face_id']
-                    
-                    if face_result['is_new']:
-                        tracking_results['new_faces'] += 1
-                    else:
-                        tracking_results['recognized_faces'] += 1
-                        # Appliquer boost de confiance pour visage reconnu
-                        boost_factor = self._calculate_confidence_boost(face_result['face_id'])
-                        tracking_results['confidence_boosts'][region_id] = boost_factor
-                        self.stats['confidence_boosts_applied'] += 1
+            # Décoder l'image une seule fois pour toutes les régions
+            image = self.face_recognition.load_image_file(image_path)
+            
+            # Encoder toutes les régions en un seul appel face_encodings
+            regions = detection_results.get('regions', [])
+            face_bboxes = [self._estimate_face_from_eye(region['bbox']) for region in regions]
+            face_encodings = self._extract_face_encodings(image, face_bboxes)
+            
+            # Chercher une correspondance pour chaque encodage retourné (une seule passe)
+            region_ids, face_ids, boosts = [], [], []
+            for region, face_encoding in zip(regions, face_encodings):
+                face_id, is_new = self._find_or_create_face(face_encoding, region)
+                region_ids.append(region['id'])
+                face_ids.append(face_id)
+                # Boost de confiance pour un visage reconnu (None pour un nouveau visage)
+                boosts.append(None if is_new else self._calculate_confidence_boost(face_id))
+            
+            # Construire les résultats en bloc
+            tracking_results['face_mappings'] = dict(zip(region_ids, face_ids))
+            tracking_results['confidence_boosts'] = {
+                region_id: boost for region_id, boost in zip(region_ids, boosts) if boost is not None
+            }
+            tracking_results['recognized_faces'] = len(boosts) - boosts.count(None)
+            tracking_results['new_faces'] = boosts.count(None)
+            self.stats['confidence_boosts_applied'] += tracking_results['recognized_faces']
             
             tracking_results['tracked_faces'] = len(tracking_results['face_mappings'])
             tracking_results['processing_time'] = time.time() - start_time
             
-            # Sauvegarder les données
-            if self.config['enable_persistence']:
+            # Sauvegarder les données (au plus toutes les save_interval secondes). Avec de
+            # nouveaux visages, le registre est écrit tout de suite, une seule fois par image et
+            # avant toute ligne d'historique pour ces ids : après un arrêt brutal,
+            # next_face_id ne peut pas réattribuer un id déjà journalisé
+            if (self.config['enable_persistence'] and self._dirty
+                    and (tracking_results['new_faces']
+                         or time.time() - self._last_save > self.config['save_interval'])):
                 self._save_data()
             
             # Mettre à jour les statistiques
@@ -135,33 +278,6 @@ class FaceHandlerV2:
             logger.error(f"Face processing failed: {e}")
             return self._create_empty_tracking_result()
     
-    def _process_single_region(self, image_path: str, region: Dict) -> Optional[Dict]:
-        """Traite une seule région pour reconnaissance faciale"""
-        try:
-            # Estimer la position du visage à partir de la région oculaire
-            bbox = region['bbox']
-            estimated_face_bbox = self._estimate_face_from_eye(bbox)
-            
-            # Extraire l'encodage facial
-            face_encoding = self._extract_face_encoding(image_path, estimated_face_bbox)
-            
-            if face_encoding is None:
-                return None
-            
-            # Chercher une correspondance
-            face_id, is_new = self._find_or_create_face(face_encoding, region)
-            
-            return {
-                'face_id': face_id,
-                'is_new': is_new,
-                'encoding': face_encoding,
-                'region_id': region['id']
-            }
-            
-        except Exception as e:
-            logger.error(f"Single region processing failed: {e}")
-            return None
-    
     def _estimate_face_from_eye(self, eye_bbox: Tuple[int, int, int, int]) -> Tuple[int, int, int, int]:
         """Estime la boîte englobante du visage à partir d'une région oculaire"""
         x, y, w, h = eye_bbox
@@ -177,62 +293,61 @@ class FaceHandlerV2:
         
         return (face_x, face_y, face_width, face_height)
     
-    def _extract_face_encoding(self, image_path: str, face_bbox: Tuple[int, int, int, int]) -> Optional[np.ndarray]:
-        """Extrait l'encodage facial d'une région"""
+    def _extract_face_encodings(self, image: np.ndarray,
+                                face_bboxes: List[Tuple[int, int, int, int]]) -> List[np.ndarray]:
+        """Extrait les encodages faciaux de toutes les régions de l'image déjà décodée
+        
+        Un seul appel face_encodings pour toutes les régions : l'initialisation
+        du prédicteur de points et du réseau dlib n'est payée qu'une fois.
+        Retourne un encodage par boîte, dans le même ordre.
+        """
+        if not face_bboxes:
+            return []
+        
         try:
-            # Charger l'image
-            image = self.face_recognition.load_image_file(image_path)
-            
-            # Convertir bbox au format face_recognition (top, right, bottom, left)
-            x, y, w, h = face_bbox
-            face_location = (y, x + w, y + h, x)
-            
-            # Extraire l'encodage
-            face_encodings = self.face_recognition.face_encodings(
-                image, [face_location]
-            )
+            # Convertir les bbox au format face_recognition (top, right, bottom, left)
+            face_locations = [(y, x + w, y + h, x) for x, y, w, h in face_bboxes]
             
-            if face_encodings:
-                return face_encodings[0]
-            else:
-                return None
+            return self.face_recognition.face_encodings(image, face_locations, num_jitters=1)
                 
         except Exception as e:
             logger.error(f"Face encoding extraction failed: {e}")
-            return None
+            return []
     
     def _find_or_create_face(self, face_encoding: np.ndarray, region: Dict) -> Tuple[str, bool]:
         """Trouve un visage existant ou en crée un nouveau"""
         try:
-            # Chercher parmi les visages connus
+            # Chercher parmi les visages connus (toutes les distances en un seul passage)
             best_match_id = None
-            best_distance = float('inf')
+            best_distance_sq = float('inf')
             
-            for face_id, face_data in self.known_faces.items():
-                known_encoding = face_data['encoding']
-                
-                # Calculer la distance
-                distance = np.linalg.norm(face_encoding - known_encoding)
-                
-                if distance < best_distance:
-                    best_distance = distance
-                    best_match_id = face_id
+            if self._faiss_index is not None and len(self._enc_ids) >= self.config['faiss_min_faces']:
+                # METRIC_L2 renvoie directement la distance L2 au carré
+                query = np.asarray(face_encoding, dtype=np.float32).reshape(1, -1)
+                distances_sq, indices = self._faiss_index.search(query, 1)
+                best_match_id = self._enc_ids[int(indices[0, 0])]
+                best_distance_sq = float(distances_sq[0, 0])
+            elif self._enc_ids:
+                best_idx, best_distance_sq = self._nearest_encoding(face_encoding)
+                best_match_id = self._enc_ids[best_idx]
             
-            # Vérifier si la correspondance est assez bonne
-            if best_match_id and best_distance < (1 - self.config['similarity_threshold']):
+            # Vérifier si la correspondance est assez bonne (distances au carré : pas de sqrt)
+            if best_match_id and best_distance_sq < self._threshold_sq:
                 # Visage reconnu
-                self.known_faces[best_match_id]['last_seen'] = datetime.now().isoformat()
+                self.known_faces[best_match_id]['last_seen_ts'] = time.time()
                 self.known_faces[best_match_id]['seen_count'] += 1
+                self._invalidate_summary(best_match_id)
+                self._dirty = True
                 return best_match_id, False
             else:
                 # Nouveau visage
                 face_id = f"child_{self.next_face_id:04d}"
                 self.next_face_id += 1
                 
+                now = time.time()
                 self.known_faces[face_id] = {
-                    'encoding': face_encoding,
-                    'first_seen': datetime.now().isoformat(),
-                    'last_seen': datetime.now().isoformat(),
+                    'first_seen_ts': now,
+                    'last_seen_ts': now,
                     'seen_count': 1,
                     'region_types': [region.get('type', 'unknown')],
                     'metadata': {
@@ -240,7 +355,10 @@ class FaceHandlerV2:
                     }
                 }
                 
-                self.analysis_history[face_id] = []
+                self.analysis_history[face_id] = self._new_history()
+                self._add_encoding(face_id, face_encoding)
+                self._invalidate_summary(face_id)
+                self._dirty = True
                 
                 return face_id, True
                 
@@ -250,21 +368,70 @@ class FaceHandlerV2:
             fallback_id = f"fallback_{int(time.time())}"
             return fallback_id, True
     
+    def _nearest_encoding(self, face_encoding: np.ndarray) -> Tuple[int, float]:
+        """Plus proche encodage connu (indice, distance L2 au carré)
+        
+        La matrice float16 est remontée en float32 par blocs pour le calcul.
+        """
+        query = np.asarray(face_encoding, dtype=np.float32)
+        distances_sq = np.empty(len(self._enc_matrix), dtype=np.float32)
+        
+        for start in range(0, len(self._enc_matrix), self.SEARCH_BLOCK_ROWS):
+            block = self._enc_matrix[start:start + self.SEARCH_BLOCK_ROWS]
+            diff = block.astype(np.float32) - query
+            distances_sq[start:start + len(block)] = np.einsum('ij,ij->i', diff, diff)
+        
+        best_idx = int(distances_sq.argmin())
+        return best_idx, float(distances_sq[best_idx])
+    
+    def _set_encodings(self, face_ids: List[str], matrix: np.ndarray):
+        """Remplace la matrice de recherche (chargement, migration ou remise à zéro)"""
+        if len(face_ids) != len(matrix):
+            raise ValueError(f"{len(face_ids)} face ids for {len(matrix)} encodings")
+        self._enc_ids = list(face_ids)
+        self._enc_buffer = None
+        # Pas de copie pour une matrice float16 mappée ; les anciennes sauvegardes float32 sont converties
+        self._enc_matrix = (np.asarray(matrix, dtype=self.ENCODING_DTYPE) if len(matrix)
+                            else np.empty((0, 128), dtype=self.ENCODING_DTYPE))
+        
+        if self._faiss_index is not None:
+            self._faiss_index.reset()
+            # FAISS n'accepte que du float32 en entrée : conversion par blocs, sans copie complète
+            for start in range(0, len(self._enc_matrix), self.SEARCH_BLOCK_ROWS):
+                block = self._enc_matrix[start:start + self.SEARCH_BLOCK_ROWS]
+                self._faiss_index.add(np.ascontiguousarray(block, dtype=np.float32))
+    
+    def _add_encoding(self, face_id: str, face_encoding: np.ndarray):
+        """Ajoute l'encodage d'un nouveau visage à la matrice de recherche"""
+        row = np.asarray(face_encoding, dtype=self.ENCODING_DTYPE).reshape(1, -1)
+        
+        # Capacité doublée quand la réserve est pleine : pas de recopie de la matrice à chaque visage
+        n = len(self._enc_matrix)
+        if self._enc_buffer is None or n >= len(self._enc_buffer):
+            buffer = np.empty((max(2 * n, 64), 128), dtype=self.ENCODING_DTYPE)
+            buffer[:n] = self._enc_matrix
+            self._enc_buffer = buffer
+        self._enc_buffer[n] = row[0]
+        self._enc_matrix = self._enc_buffer[:n + 1]
+        self._enc_ids.append(face_id)
+        
+        if self._faiss_index is not None:
+            # FAISS n'accepte que du float32 en entrée (stocké en float16 par l'index)
+            self._faiss_index.add(row.astype(np.float32))
+    
     def _calculate_confidence_boost(self, face_id: str) -> float:
         """Calcule le boost de confiance pour un visage reconnu"""
         try:
             if face_id not in self.analysis_history:
                 return 1.0
             
-            history = self.analysis_history[face_id]
             seen_count = self.known_faces.get(face_id, {}).get('seen_count', 1)
             
             # Plus l'enfant a été vu et analysé, plus le boost est important
             base_boost = min(1.5, 1.0 + (seen_count - 1) * 0.1)
             
             # Bonus si des analyses précédentes ont détecté quelque chose
-            positive_analyses = sum(1 for analysis in history 
-                                  if analysis.get('has_positive_findings', False))
+            positive_analyses = self._positive_counts.get(face_id, 0)
             
             if positive_analyses > 0:
                 consistency_boost = min(1.3, 1.0 + positive_analyses * 0.15)
@@ -276,11 +443,28 @@ class FaceHandlerV2:
             logger.error(f"Confidence boost calculation failed: {e}")
             return 1.0
     
+    def _new_history(self, entries=()) -> deque:
+        """Crée un historique borné : append évince l'entrée la plus ancienne en O(1)"""
+        return deque(entries, maxlen=self.config['max_history_per_face'])
+    
+    def _count_positives(self, face_id: str):
+        """Met à jour le nombre d'analyses positives dans l'historique d'un visage"""
+        self._positive_counts[face_id] = sum(
+            1 for entry in self.analysis_history.get(face_id, [])
+            if entry.get('has_positive_findings', False)
+        )
+    
+    def _rebuild_positive_counts(self):
+        """Recalcule tous les compteurs d'analyses positives (après chargement)"""
+        self._positive_counts = {}
+        for face_id in self.analysis_history:
+            self._count_positives(face_id)
+    
     def add_analysis_result(self, face_id: str, analysis_results: Dict, image_path: str):
         """Ajoute un résultat d'analyse à l'historique d'un visage"""
         try:
             if face_id not in self.analysis_history:
-                self.analysis_history[face_id] = []
+                self.analysis_history[face_id] = self._new_history()
             
             # Détecter s'il y a des findings positifs
             has_positive = any(
@@ -290,7 +474,7 @@ class FaceHandlerV2:
             
             # Créer l'entrée d'historique
             history_entry = {
-                'timestamp': datetime.now().isoformat(),
+                'timestamp': time.time(),  # Formaté en ISO seulement pour l'affichage/export
                 'image_path': image_path,
                 'has_positive_findings': has_positive,
                 'analysis_summary': {
@@ -301,13 +485,18 @@ class FaceHandlerV2:
                 }
             }
             
-            # Ajouter à l'historique
+            # Ajouter à l'historique (la deque évince elle-même les entrées les plus anciennes)
             self.analysis_history[face_id].append(history_entry)
             
-            # Limiter la taille de l'historique
-            max_history = self.config['max_history_per_face']
-            if len(self.analysis_history[face_id]) > max_history:
-                self.analysis_history[face_id] = self.analysis_history[face_id][-max_history:]
+            # Persistance immédiate en O(1) : une ligne ajoutée au journal NDJSON
+            if self.config['enable_persistence']:
+                with open(self.history_log_path, 'ab') as f:
+                    f.write(self._history_log_line(face_id, history_entry))
+            
+            # Recompter à l'écriture pour que les lectures (boost, résumés) soient en O(1)
+            self._count_positives(face_id)
+            self._invalidate_summary(face_id)
+            self._history_stats_cache.pop(face_id, None)
             
             logger.info(f"Analysis result added to face {face_id} history")
             
@@ -315,7 +504,32 @@ class FaceHandlerV2:
             logger.error(f"Failed to add analysis result: {e}")
     
     def get_face_analysis_summary(self, face_id: str) -> Dict:
-        """Retourne un résumé des analyses pour un visage"""
+        """Retourne un résumé des analyses pour un visage
+        
+        Le résumé est mis en cache jusqu'à la prochaine modification du visage
+        (nouvelle analyse, nouvelle reconnaissance ou ajustement de confiance) ;
+        une copie profonde est retournée pour que l'appelant ne puisse pas altérer le cache.
+        """
+        return copy.deepcopy(self._cached_face_summary(face_id))
+    
+    def _cached_face_summary(self, face_id: str) -> Dict:
+        """Résumé d'un visage depuis le cache (partagé : ne pas modifier)"""
+        cached = self._summary_cache.get(face_id)
+        if cached is not None:
+            return cached
+        
+        summary = self._build_face_analysis_summary(face_id)
+        if 'error' not in summary:
+            self._summary_cache[face_id] = summary
+        return summary
+    
+    def _invalidate_summary(self, face_id: str):
+        """Invalide le résumé d'un visage et la liste triée des visages suivis"""
+        self._summary_cache.pop(face_id, None)
+        self._faces_version += 1
+    
+    def _build_face_analysis_summary(self, face_id: str) -> Dict:
+        """Calcule le résumé des analyses d'un visage"""
         try:
             if face_id not in self.analysis_history:
                 return {'error': 'Face not found'}
@@ -328,14 +542,14 @@ class FaceHandlerV2:
                     'face_id': face_id,
                     'total_analyses': 0,
                     'positive_analyses': 0,
-                    'first_seen': face_data.get('first_seen'),
-                    'last_seen': face_data.get('last_seen'),
+                    'first_seen': self._format_timestamp(face_data.get('first_seen_ts')),
+                    'last_seen': self._format_timestamp(face_data.get('last_seen_ts')),
                     'recommendation': 'No analysis history available'
                 }
             
             # Calculer les statistiques
             total_analyses = len(history)
-            positive_analyses = sum(1 for entry in history if entry['has_positive_findings'])
+            positive_analyses = self._positive_counts.get(face_id, 0)
             consistency_rate = (positive_analyses / total_analyses) * 100 if total_analyses > 0 else 0
             
             # Déterminer la recommandation
@@ -357,37 +571,78 @@ class FaceHandlerV2:
                 'total_analyses': total_analyses,
                 'positive_analyses': positive_analyses,
                 'consistency_rate': consistency_rate,
-                'first_seen': face_data.get('first_seen'),
-                'last_seen': face_data.get('last_seen'),
+                'first_seen': self._format_timestamp(face_data.get('first_seen_ts')),
+                'last_seen': self._format_timestamp(face_data.get('last_seen_ts')),
                 'seen_count': face_data.get('seen_count', 0),
                 'recommendation': recommendation,
                 'urgency': urgency,
-                'recent_analyses': history[-3:] if len(history) > 3 else history
+                'recent_analyses': [self._format_history_entry(entry)
+                                    for entry in islice(history, max(0, len(history) - 3), None)]
             }
             
         except Exception as e:
             logger.error(f"Face summary generation failed: {e}")
             return {'error': str(e)}
     
+    @staticmethod
+    def _format_timestamp(ts: Optional[float]) -> Optional[str]:
+        """Timestamp UNIX -> chaîne ISO (uniquement pour l'affichage et l'export)"""
+        return datetime.fromtimestamp(ts).isoformat() if ts else None
+    
+    @staticmethod
+    def _to_timestamp(value) -> float:
+        """Horodatage ISO (ancien format de sauvegarde) ou numérique -> timestamp UNIX"""
+        if isinstance(value, str):
+            return datetime.fromisoformat(value).timestamp()
+        return float(value or 0)
+    
+    def _format_history_entry(self, entry: Dict) -> Dict:
+        """Copie d'une entrée d'historique avec l'horodatage en ISO"""
+        return {**entry, 'timestamp': self._format_timestamp(entry.get('timestamp'))}
+    
+    def _format_face_metadata(self, face_data: Dict) -> Dict:
+        """Copie des métadonnées d'un visage avec les horodatages en ISO"""
+        formatted = {k: v for k, v in face_data.items() if k not in ('first_seen_ts', 'last_seen_ts')}
+        formatted['first_seen'] = self._format_timestamp(face_data.get('first_seen_ts'))
+        formatted['last_seen'] = self._format_timestamp(face_data.get('last_seen_ts'))
+        return formatted
+    
     def get_all_tracked_faces(self) -> List[Dict]:
-        """Retourne un résumé de tous les visages suivis"""
+        """Retourne un résumé de tous les visages suivis
+        
+        La liste triée est mise en cache jusqu'à la prochaine modification d'un visage
+        (au plus tracked_faces_ttl secondes) ; une seule copie profonde est retournée.
+        """
+        cached = self._tracked_faces_cache
+        if (cached is not None and cached[0] == self._faces_version
+                and time.time() - cached[1] < self.config['tracked_faces_ttl']):
+            return copy.deepcopy(cached[2])
+        
+        version = self._faces_version
+        tracked = self._sorted_tracked_faces()
+        if tracked:
+            self._tracked_faces_cache = (version, time.time(), tracked)
+        return copy.deepcopy(tracked)
+    
+    def _sorted_tracked_faces(self) -> List[Dict]:
+        """Résumés de tous les visages suivis, triés par urgence (partagés avec le cache)"""
         try:
             summaries = []
             
             for face_id in self.known_faces.keys():
-                summary = self.get_face_analysis_summary(face_id)
+                summary = self._cached_face_summary(face_id)
                 if 'error' not in summary:
                     summaries.append(summary)
             
-            # Trier par urgence puis par nombre d'analyses positives
+            # Trier par urgence puis par nombre d'analyses positives (tri stable sur colonnes)
             urgency_order = {'immediate': 0, 'urgent': 1, 'soon': 2, 'routine': 3}
-            summaries.sort(key=lambda x: (
-                urgency_order.get(x.get('urgency', 'routine'), 3),
-                -x.get('positive_analyses', 0),
-                -x.get('total_analyses', 0)
+            order = np.lexsort((
+                [-x.get('total_analyses', 0) for x in summaries],
+                [-x.get('positive_analyses', 0) for x in summaries],
+                [urgency_order.get(x.get('urgency', 'routine'), 3) for x in summaries]
             ))
             
-            return summaries
+            return [summaries[i] for i in order]
             
         except Exception as e:
             logger.error(f"Failed to get tracked faces: {e}")
@@ -426,45 +681,215 @@ class FaceHandlerV2:
     def _load_data(self):
         """Charge les données persistantes"""
         try:
-            # Charger les visages connus
-            if self.faces_db_path.exists():
+            # Charger les visages connus : métadonnées JSON + matrice float16 en mmap
+            if self.faces_meta_path.exists():
+                with open(self.faces_meta_path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                self.known_faces = data.get('known_faces', {})
+                self.next_face_id = data.get('next_face_id', 1)
+                
+                face_ids = data.get('ids', [])
+                stored_path = self.data_dir / data.get('encodings_file', self.npy_encodings_path.name)
+                self._enc_saved_rows = len(face_ids)
+                if face_ids:
+                    stored = self._read_encodings(stored_path)
+                    self._set_encodings(face_ids, stored)
+                    if stored.dtype != self.ENCODING_DTYPE:
+                        self._enc_saved_rows = 0  # Ancienne sauvegarde float32 : réécrite en float16
+                if stored_path != self.encodings_path:
+                    self._enc_saved_rows = 0  # Réécrite au format courant à la prochaine sauvegarde
+                
+                logger.info(f"Loaded {len(self.known_faces)} known faces")
+            
+            elif self.faces_db_path.exists():
+                # Ancien format pickle : converti au prochain enregistrement
                 with open(self.faces_db_path, 'rb') as f:
                     data = pickle.load(f)
-                    self.known_faces = data.get('known_faces', {})
-                    self.next_face_id = data.get('next_face_id', 1)
+                self.known_faces = data.get('known_faces', {})
+                self.next_face_id = data.get('next_face_id', 1)
                 
-                logger.info(f"Loaded {len(self.known_faces)} known faces")
+                encodings = {face_id: face_data.pop('encoding')
+                             for face_id, face_data in self.known_faces.items()
+                             if 'encoding' in face_data}
+                self._set_encodings(
+                    list(encodings),
+                    np.asarray(list(encodings.values()), dtype=self.ENCODING_DTYPE).reshape(-1, 128)
+                )
+                self._enc_saved_rows = 0
+                
+                logger.info(f"Loaded {len(self.known_faces)} known faces (legacy pickle)")
             
-            # Charger l'historique
-            if self.history_path.exists():
-                with open(self.history_path, 'r', encoding='utf-8') as f:
-                    self.analysis_history = json.load(f)
+            # Charger l'historique : journal NDJSON lu en flux, ou ancien JSON complet
+            self.analysis_history = {face_id: self._new_history() for face_id in self.known_faces}
+            rewrite_log = False
+            
+            if self.history_log_path.exists():
+                lines_read, discarded = self._read_history_log()
+                
+                # Le journal grossit sans limite alors que seules max_history_per_face
+                # entrées par visage sont conservées : on le compacte au démarrage
+                # (ou on le répare si des lignes ont été écartées)
+                retained = sum(len(history) for history in self.analysis_history.values())
+                rewrite_log = discarded or lines_read > 2 * retained
                 
                 logger.info(f"Loaded analysis history for {len(self.analysis_history)} faces")
+            
+            elif self.history_path.exists():
+                with open(self.history_path, 'r', encoding='utf-8') as f:
+                    for face_id, entries in json.load(f).items():
+                        self.analysis_history[face_id] = self._new_history(entries)
+                rewrite_log = True
+                
+                logger.info(f"Loaded analysis history for {len(self.analysis_history)} faces (legacy JSON)")
+            
+            self._migrate_timestamps()
+            
+            if rewrite_log and self.config['enable_persistence']:
+                self._rewrite_history_log()
                 
         except Exception as e:
             logger.error(f"Failed to load face data: {e}")
             self.known_faces = {}
             self.analysis_history = {}
             self.next_face_id = 1
+            self._set_encodings([], np.empty((0, 128), dtype=self.ENCODING_DTYPE))
+            self._enc_saved_rows = 0
+    
+    def _read_history_log(self) -> Tuple[int, bool]:
+        """Relit le journal NDJSON ligne par ligne dans les deques
+        
+        Les lignes dont le visage est absent du registre (id jamais enregistré, ou
+        id de secours) sont mises en quarantaine dans history_orphans_path : elles
+        ne doivent pas être rattachées à un enfant qui recevrait plus tard cet id.
+        Retourne le nombre d'entrées lues et si des lignes ont été écartées
+        """
+        lines_read = 0
+        discarded = False
+        orphans = []
+        with open(self.history_log_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # Dernière ligne tronquée par un arrêt brutal : ignorée
+                    logger.warning("Skipping malformed line in analysis history log")
+                    discarded = True
+                    continue
+                
+                # JSON valide mais pas une entrée (pas un objet, ou sans face_id) : ignorée
+                # aussi, pour qu'une seule ligne ne fasse pas échouer tout le chargement
+                if not isinstance(entry, dict) or 'face_id' not in entry:
+                    logger.warning("Skipping invalid entry in analysis history log")
+                    discarded = True
+                    continue
+                
+                face_id = entry.pop('face_id')
+                lines_read += 1
+                
+                if face_id not in self.known_faces:
+                    orphans.append(line if line.endswith('\n') else line + '\n')
+                    continue
+                
+                # Marqueur d'ajustement : replié sur l'entrée de même horodatage
+                if 'adjusted_ts' in entry:
+                    for previous in reversed(self.analysis_history[face_id]):
+                        if previous.get('timestamp') == entry['adjusted_ts']:
+                            previous['has_confidence_adjustment'] = True
+                            break
+                    continue
+                
+                self.analysis_history[face_id].append(entry)
+        
+        if orphans:
+            logger.warning(f"Quarantined {len(orphans)} analysis history lines for unknown faces")
+            with open(self.history_orphans_path, 'a', encoding='utf-8') as f:
+                f.writelines(orphans)
+            discarded = True
+        
+        return lines_read, discarded
+    
+    @staticmethod
+    def _history_log_line(face_id: str, entry: Dict) -> bytes:
+        """Sérialise une entrée d'historique en une ligne NDJSON"""
+        return _dumps({'face_id': face_id, **entry}, indent=False) + b'\n'
+    
+    def _rewrite_history_log(self):
+        """Réécrit le journal avec les seules entrées conservées en mémoire"""
+        tmp_path = self.history_log_path.with_suffix('.tmp')
+        with open(tmp_path, 'wb') as f:
+            for face_id, history in self.analysis_history.items():
+                for entry in history:
+                    f.write(self._history_log_line(face_id, entry))
+        os.replace(tmp_path, self.history_log_path)
+    
+    def _migrate_timestamps(self):
+        """Convertit les horodatages ISO des anciennes sauvegardes en timestamps UNIX"""
+        for face_data in self.known_faces.values():
+            for old_key in ('first_seen', 'last_seen'):
+                if old_key in face_data:
+                    face_data[f'{old_key}_ts'] = self._to_timestamp(face_data.pop(old_key))
+        
+        for history in self.analysis_history.values():
+            for entry in history:
+                if isinstance(entry.get('timestamp'), str):
+                    entry['timestamp'] = self._to_timestamp(entry['timestamp'])
+    
+    def _read_encodings(self, path: Path) -> np.ndarray:
+        """Lit la matrice des encodages (.b2nd décompressé, ou .npy mappé en mémoire)"""
+        if path.suffix == '.b2nd':
+            if not BLOSC2_AVAILABLE:
+                # Ne pas écraser une base que l'on ne sait pas relire
+                self.config['enable_persistence'] = False
+                raise RuntimeError(f"{path.name} requires blosc2 - persistence disabled")
+            return blosc2.open(str(path), mode='r', mmap_mode='r')[:]
+        return np.load(path, mmap_mode='r')
+    
+    def _write_encodings(self):
+        """Écrit la matrice des encodages via un fichier temporaire puis un remplacement atomique"""
+        matrix = np.ascontiguousarray(self._enc_matrix, dtype=self.ENCODING_DTYPE)
+        
+        if BLOSC2_AVAILABLE:
+            tmp_path = self.encodings_path.with_suffix('.tmp.b2nd')
+            blosc2.asarray(matrix, urlpath=str(tmp_path), mode='w',
+                           cparams={'codec': blosc2.Codec.ZSTD, 'clevel': 3, 'nthreads': 4})
+        else:
+            tmp_path = self.encodings_path.with_suffix('.tmp.npy')
+            np.save(tmp_path, matrix)
+        os.replace(tmp_path, self.encodings_path)
     
     def _save_data(self):
         """Sauvegarde les données persistantes"""
         try:
-            # Sauvegarder les visages connus
+            # Encodages : la matrice n'est réécrite que si des visages ont été ajoutés
+            # (une matrice encore mappée en mémoire ne peut pas être remplacée sous Windows)
+            if len(self._enc_ids) != self._enc_saved_rows:
+                self._write_encodings()
+                self._enc_saved_rows = len(self._enc_ids)
+            
+            # Métadonnées des visages connus ; 'ids' donne l'ordre des lignes de la matrice
             data = {
+                'ids': self._enc_ids,
+                'encodings_file': self.encodings_path.name,
                 'known_faces': self.known_faces,
                 'next_face_id': self.next_face_id,
                 'saved_at': datetime.now().isoformat()
             }
             
-            with open(self.faces_db_path, 'wb') as f:
-                pickle.dump(data, f)
+            with open(self.faces_meta_path, 'wb') as f:
+                f.write(_dumps(data))
             
-            # Sauvegarder l'historique
-            with open(self.history_path, 'w', encoding='utf-8') as f:
-                json.dump(self.analysis_history, f, indent=2, default=str)
+            # Les métadonnées pointent sur le format courant : l'autre fichier est périmé
+            for path in (self.npy_encodings_path, self.b2_encodings_path):
+                if path != self.encodings_path and path.exists():
+                    path.unlink()
             
+            # L'historique n'est pas réécrit ici : chaque analyse est ajoutée
+            # au journal NDJSON dès add_analysis_result
+            
+            self._dirty = False
+            self._last_save = time.time()
             logger.debug("Face data saved successfully")
             
         except Exception as e:
@@ -496,8 +921,9 @@ class FaceHandlerV2:
                     'report_type': 'longitudinal_analysis'
                 },
                 'face_summary': summary,
-                'detailed_history': self.analysis_history.get(face_id, []),
-                'face_metadata': self.known_faces.get(face_id, {}),
+                'detailed_history': [self._format_history_entry(entry)
+                                     for entry in self.analysis_history.get(face_id, [])],
+                'face_metadata': self._format_face_metadata(self.known_faces.get(face_id, {})),
                 'recommendations': {
                     'medical_action': summary.get('recommendation', 'Unknown'),
                     'urgency_level': summary.get('urgency', 'routine'),
@@ -506,8 +932,8 @@ class FaceHandlerV2:
             }
             
             # Sauvegarder
-            with open(output_path, 'w', encoding='utf-8') as f:
-                json.dump(full_report, f, indent=2, default=str)
+            with open(output_path, 'wb') as f:
+                f.write(_dumps(full_report))
             
             logger.info(f"Face report exported: {output_path}")
             return str(output_path)
@@ -558,13 +984,20 @@ class FaceHandlerV2:
             # Vider les données en mémoire
             self.known_faces = {}
             self.analysis_history = {}
+            self._positive_counts = {}
+            self._summary_cache = {}
+            self._faces_version += 1
+            self._tracked_faces_cache = None
+            self._history_stats_cache = {}
             self.next_face_id = 1
+            self._set_encodings([], np.empty((0, 128), dtype=self.ENCODING_DTYPE))
+            self._enc_saved_rows = 0
             
             # Supprimer les fichiers
-            if self.faces_db_path.exists():
-                self.faces_db_path.unlink()
-            if self.history_path.exists():
-                self.history_path.unlink()
+            for path in (self.faces_db_path, self.npy_encodings_path, self.b2_encodings_path, self.faces_meta_path,
+                         self.history_path, self.history_log_path, self.history_orphans_path):
+                if path.exists():
+                    path.unlink()
             
             # Réinitialiser les stats
             self.stats = {
@@ -584,8 +1017,8 @@ class FaceHandlerV2:
     def cleanup(self):
         """Nettoie les ressources"""
         try:
-            # Sauvegarder avant fermeture
-            if self.config['enable_persistence']:
+            # Sauvegarder avant fermeture ce qui n'a pas encore été écrit
+            if self.config['enable_persistence'] and self._dirty:
                 self._save_data()
             
             logger.info("Face handler cleaned up")
@@ -593,9 +1026,13 @@ class FaceHandlerV2:
         except Exception as e:
             logger.error(f"Cleanup error: {e}")
     
-    def __del__(self):
-        """Nettoyage automatique"""
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Sauvegarde explicite en sortie de bloc (plus de sauvegarde depuis le ramasse-miettes)"""
         self.cleanup()
+        return False
 
     def adjust_confidence_with_history(self, face_id: str, current_analysis_results: List[Dict]) -> List[Dict]:
         """Ajuste la confiance basée sur l'historique médical"""
@@ -607,47 +1044,28 @@ class FaceHandlerV2:
             if len(history) < 2:
                 return current_analysis_results  # Pas assez d'historique
 
-            # Analyser l'historique récent (30 derniers jours)
-            from datetime import datetime, timedelta
-            import time
-
-            recent_cutoff = time.time() - (30 * 24 * 3600)
-            recent_analyses = [
-                entry for entry in history 
-                if entry.get('timestamp', 0) > recent_cutoff
-            ]
-
-            if not recent_analyses:
+            # Tendances historiques du patient (mises en cache), communes à tous les résultats courants
+            stats = self._get_history_stats(face_id, history)
+            if stats is None:
                 return current_analysis_results
 
-            # Calculer les tendances historiques
-            historical_positives = []
-            historical_confidences = []
-
-            for entry in recent_analyses:
-                analysis = entry.get('analysis_summary', {})
-                if analysis:
-                    positive_detections = analysis.get('positive_detections', 0)
-                    historical_positives.append(positive_detections > 0)
-                    # Estimer la confiance moyenne
-                    if 'regions_analyzed' in analysis and analysis['regions_analyzed'] > 0:
-                        avg_conf = 50 if positive_detections > 0 else 20  # Estimation
-                        historical_confidences.append(avg_conf)
-
-            if not historical_positives:
-                return current_analysis_results
+            positive_rate = stats['positive_rate']
+            avg_historical_confidence = stats['avg_historical_confidence']
+            recent_positive_trend = stats['recent_positive_trend']
 
-            # Calculer les facteurs d'ajustement
-            positive_rate = sum(historical_positives) / len(historical_positives)
-            avg_historical_confidence = sum(historical_confidences) / len(historical_confidences) if historical_confidences else 50
+            logger.info("Patient %s: %.0f%% positive rate in recent history", face_id, positive_rate * 100)
 
-            logger.info(f"Patient {face_id}: {positive_rate:.0%} positive rate in recent history")
+            # Résumé identique pour tous les résultats ajustés de ce patient
+            history_summary = {
+                'positive_rate': positive_rate,
+                'recent_analyses_count': stats['recent_analyses_count'],
+                'avg_historical_confidence': avg_historical_confidence
+            }
 
-            # Appliquer les ajustements
-            adjusted_results = []
+            # Calculer le facteur d'ajustement de chaque résultat
+            adjustments: List[_Adjustment] = []
 
-            for i, result in enumerate(current_analysis_results):
-                adjusted_result = result.copy()
+            for result in current_analysis_results:
                 original_confidence = result.get('confidence', 0)
                 original_detected = result.get('leukocoria_detected', False)
 
@@ -679,24 +1097,18 @@ class FaceHandlerV2:
                         reasoning.append("No detection but positive history warrants caution")
 
                 # 4. Ajustement basé sur la stabilité des mesures
-                current_confidence = original_confidence
-                confidence_diff = abs(current_confidence - avg_historical_confidence)
+                confidence_diff = abs(original_confidence - avg_historical_confidence)
 
                 if confidence_diff > 30:  # Grande différence par rapport à la moyenne
-                    if current_confidence > avg_historical_confidence:
+                    if original_confidence > avg_historical_confidence:
                         adjustment_factor += 0.05
                         reasoning.append("Higher confidence than historical average")
                     else:
                         adjustment_factor -= 0.05
                         reasoning.append("Lower confidence than historical average")
 
-                # 5. Ajustement pour cohérence temporelle
-                if len(recent_analyses) >= 3:
-                    # Vérifier la tendance des 3 dernières analyses
-                    last_three = recent_analyses[-3:]
-                    recent_positive_trend = sum(1 for entry in last_three 
-                                              if entry.get('analysis_summary', {}).get('positive_detections', 0) > 0)
-
+                # 5. Ajustement pour cohérence temporelle (tendance des 3 dernières analyses)
+                if recent_positive_trend is not None:
                     if recent_positive_trend >= 2 and original_detected:
                         adjustment_factor += 0.1
                         reasoning.append("Consistent with recent positive trend")
@@ -704,36 +1116,60 @@ class FaceHandlerV2:
                         adjustment_factor += 0.15  # Plus fort car possible faux négatif
                         reasoning.append("Inconsistent with recent positive trend - increase sensitivity")
 
-                # === APPLIQUER L'AJUSTEMENT ===
-                if adjustment_factor != 0:
-                    new_confidence = original_confidence * (1 + adjustment_factor)
-                    new_confidence = max(0, min(100, new_confidence))  # Borner entre 0 et 100
-
-                    adjusted_result['confidence'] = new_confidence
-                    adjusted_result['confidence_adjusted'] = True
-                    adjusted_result['original_confidence'] = original_confidence
-                    adjusted_result['adjustment_factor'] = adjustment_factor
-                    adjusted_result['adjustment_reasoning'] = reasoning
-                    adjusted_result['patient_history_summary'] = {
-                        'positive_rate': positive_rate,
-                        'recent_analyses_count': len(recent_analyses),
-                        'avg_historical_confidence': avg_historical_confidence
-                    }
+                adjustments.append(_Adjustment(original_confidence, original_detected,
+                                               adjustment_factor, reasoning))
+
+            # === APPLIQUER LES AJUSTEMENTS ===
+            adjusted_rows = [i for i, adjustment in enumerate(adjustments) if adjustment.factor != 0]
+            if not adjusted_rows:
+                return [dict(result) for result in current_analysis_results]
+
+            self._mark_confidence_adjusted(face_id, history[-1])
+
+            # Nouvelles confiances bornées entre 0 et 100, en un seul calcul vectoriel
+            new_confidences = dict(zip(adjusted_rows, self._batch_adjust_confidences(
+                np.array([adjustments[i].original_confidence for i in adjusted_rows], dtype=np.float64),
+                np.array([adjustments[i].factor for i in adjusted_rows], dtype=np.float64)
+            ).tolist()))
+
+            adjusted_results = []
+
+            for i, result in enumerate(current_analysis_results):
+                adjusted_result = dict(result)
+
+                if i in new_confidences:
+                    new_confidence = new_confidences[i]
+                    adjustment = adjustments[i]
+                    original_confidence = adjustment.original_confidence
+                    adjustment_factor = adjustment.factor
+                    reasoning = adjustment.reasoning
+
+                    adjusted_result.update(
+                        confidence=new_confidence,
+                        confidence_adjusted=True,
+                        original_confidence=original_confidence,
+                        adjustment_factor=adjustment_factor,
+                        adjustment_reasoning=reasoning,
+                        patient_history_summary=dict(history_summary)
+                    )
 
                     # Réévaluer le risque si changement significatif
                     if abs(new_confidence - original_confidence) > 10:
                         adjusted_result = self._reevaluate_risk_level_with_history(adjusted_result)
 
                     # Réévaluer la détection si boost significatif
-                    if (not original_detected and 
+                    if (not adjustment.original_detected and 
                         new_confidence > 50 and 
                         adjustment_factor > 0.1):
                         adjusted_result['leukocoria_detected'] = True
                         adjusted_result['detection_changed_by_history'] = True
                         reasoning.append("Detection status changed based on patient history")
 
-                    logger.info(f"Patient {face_id}, region {i}: Confidence adjusted from {original_confidence:.1f}% to {new_confidence:.1f}%")
-                    logger.info(f"Reasoning: {'; '.join(reasoning)}")
+                    # Formatage différé : rien n'est construit si le niveau INFO est désactivé
+                    logger.info("Patient %s, region %d: Confidence adjusted from %.1f%% to %.1f%%",
+                                face_id, i, original_confidence, new_confidence)
+                    if logger.isEnabledFor(logging.INFO):
+                        logger.info("Reasoning: %s", "; ".join(reasoning))
 
                 adjusted_results.append(adjusted_result)
 
@@ -743,6 +1179,77 @@ class FaceHandlerV2:
             logger.error(f"Confidence adjustment failed for {face_id}: {e}")
             return current_analysis_results
 
+    def _get_history_stats(self, face_id: str, history: deque) -> Optional[Dict]:
+        """Tendances de l'historique récent (30 derniers jours) d'un patient
+        
+        Mises en cache par patient et recalculées seulement quand une analyse est ajoutée
+        ou quand des analyses sortent de la fenêtre. None si aucune analyse récente exploitable.
+        """
+        # Les entrées sont ajoutées dans l'ordre chronologique : la coupure se trouve par dichotomie
+        recent_cutoff = time.time() - (30 * 24 * 3600)
+        start = bisect_right(_TimestampView(history), recent_cutoff)
+        count = len(history) - start
+        
+        cached = self._history_stats_cache.get(face_id)
+        if cached is not None and cached[0] == count:
+            return cached[1]
+        
+        stats = self._compute_history_stats(islice(history, start, None))
+        self._history_stats_cache[face_id] = (count, stats)
+        return stats
+    
+    @staticmethod
+    def _compute_history_stats(recent_analyses: Iterable[Dict]) -> Optional[Dict]:
+        """Calcule taux de positifs, confiance historique estimée et tendance récente
+        
+        Les indicateurs par analyse sont extraits dans des tableaux booléens NumPy.
+        """
+        summaries = [entry.get('analysis_summary') or {} for entry in recent_analyses]
+        count = len(summaries)
+        if not count:
+            return None
+        
+        has_summary = np.fromiter((bool(analysis) for analysis in summaries), dtype=bool, count=count)
+        positives = np.fromiter((analysis.get('positive_detections', 0) > 0 for analysis in summaries),
+                                dtype=bool, count=count)
+        with_regions = np.fromiter((analysis.get('regions_analyzed', 0) > 0 for analysis in summaries),
+                                   dtype=bool, count=count)
+        
+        if not has_summary.any():
+            return None
+        
+        # Confiance historique estimée : 50 pour une analyse positive, 20 sinon
+        historical_confidences = np.where(positives, 50, 20)[has_summary & with_regions]
+        
+        return {
+            'positive_rate': float(positives[has_summary].mean()),
+            'avg_historical_confidence': (float(historical_confidences.mean())
+                                          if historical_confidences.size else 50),
+            # Tendance des 3 dernières analyses (seulement si au moins 3 analyses récentes)
+            'recent_positive_trend': int(positives[-3:].sum()) if count >= 3 else None,
+            'recent_analyses_count': count
+        }
+    
+    def _mark_confidence_adjusted(self, face_id: str, entry: Dict):
+        """Marque une entrée d'historique comme ajustée par l'historique du patient
+        
+        L'entrée est déjà dans le journal : un marqueur compact {face_id, adjusted_ts}
+        y est ajouté, replié sur l'entrée à la relecture puis effacé par le compactage.
+        """
+        if entry.get('has_confidence_adjustment'):
+            return
+        entry['has_confidence_adjustment'] = True
+        self._invalidate_summary(face_id)
+        
+        if self.config['enable_persistence']:
+            with open(self.history_log_path, 'ab') as f:
+                f.write(_dumps({'face_id': face_id, 'adjusted_ts': entry.get('timestamp')}, indent=False) + b'\n')
+    
+    @staticmethod
+    def _batch_adjust_confidences(originals: np.ndarray, factors: np.ndarray) -> np.ndarray:
+        """Applique les facteurs d'ajustement et borne les confiances entre 0 et 100"""
+        return np.clip(originals * (1.0 + factors), 0.0, 100.0)
+
     def _reevaluate_risk_level_with_history(self, result: Dict) -> Dict:
         """Réévalue le niveau de risque basé sur la nouvelle confiance et l'historique"""
         try:
@@ -751,42 +1258,26 @@ class FaceHandlerV2:
             has_history_adjustment = result.get('confidence_adjusted', False)
             adjustment_factor = result.get('adjustment_factor', 0)
 
-            # Seuils ajustés pour les cas avec historique
-            if detected:
-                if confidence >= 85 or (confidence >= 75 and has_history_adjustment):
-                    result['risk_level'] = 'high'
-                    result['urgency'] = 'immediate'
-                    result['medical_reasoning'] = (result.get('medical_reasoning', '') + 
-                        " High confidence with patient history support.")
-                elif confidence >= 65 or (confidence >= 55 and has_history_adjustment):
-                    result['risk_level'] = 'medium'
-                    result['urgency'] = 'urgent'
-                    result['medical_reasoning'] = (result.get('medical_reasoning', '') + 
-                        " Moderate confidence enhanced by patient history.")
-                elif confidence >= 45:
-                    result['risk_level'] = 'medium'
-                    result['urgency'] = 'soon'
-                else:
-                    result['risk_level'] = 'low'
-                    result['urgency'] = 'routine'
-            else:
-                # Même pour les non-détectés, vérifier si confiance ajustée suggère surveillance
-                if has_history_adjustment and confidence > 30:
-                    result['risk_level'] = 'low'
-                    result['urgency'] = 'soon'
-                    result['recommendation_note'] = 'Continue close monitoring due to patient history'
-                elif has_history_adjustment and adjustment_factor > 0.1:
-                    # Fort ajustement même sans détection = surveillance renforcée
-                    result['urgency'] = 'soon'
-                    result['recommendation_note'] = 'Enhanced monitoring recommended based on patient history'
+            # Décision purement numérique, puis traduction du code en champs texte
+            outcome = _RISK_OUTCOMES[_risk_outcome_code(
+                confidence, detected, has_history_adjustment, adjustment_factor
+            )]
+            if outcome is not None:
+                risk_level, urgency, reasoning_suffix, note = outcome
+                if risk_level is not None:
+                    result['risk_level'] = risk_level
+                result['urgency'] = urgency
+                if reasoning_suffix is not None:
+                    result['medical_reasoning'] = result.get('medical_reasoning', '') + reasoning_suffix
+                if note is not None:
+                    result['recommendation_note'] = note
 
             # Ajouter note spéciale pour les cas ajustés par l'historique
             if has_history_adjustment:
                 history_note = f"Confidence adjusted by {adjustment_factor:+.1%} based on patient history. "
-                if 'recommendations' in result:
-                    result['recommendations'] = history_note + result['recommendations']
-                else:
-                    result['recommendations'] = history_note + "Continue medical monitoring as advised."
+                result['recommendations'] = history_note + result.get(
+                    'recommendations', "Continue medical monitoring as advised."
+                )
 
             return result
 
@@ -807,13 +1298,11 @@ class FaceHandlerV2:
             total_analyses = len(history)
 
             for entry in history:
-                if (entry.get('analysis_summary', {}).get('confidence_adjustments') or 
-                    'confidence_adjusted' in str(entry)):
+                if entry.get('has_confidence_adjustment', False):
                     adjustments_applied += 1
 
             # Analyser les tendances
-            positive_analyses = sum(1 for entry in history 
-                                  if entry.get('has_positive_findings', False))
+            positive_analyses = self._positive_counts.get(face_id, 0)
 
             summary = {
                 'face_id': face_id,
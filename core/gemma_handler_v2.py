@@ -9,7 +9,7 @@ import logging
 import json
 import time
 from pathlib import Path
-from typing import Dict, List, Optional, Union
+from typing import Callable, Dict, List, Optional, Union
 import warnings
 warnings.filterwarnings("ignore")
 
@@ -215,8 +215,12 @@ class GemmaHandlerV2:
         """Vérifie si le modèle est prêt pour l'analyse"""
         return self.ready and self.initialized
     
-    def analyze_eye_regions(self, eye_regions: List[Dict], confidence_threshold: float = 0.5) -> Dict:
-        """Analyse plusieurs régions oculaires avec Gemma 3n"""
+    def analyze_eye_regions(self, eye_regions: List[Dict], confidence_threshold: float = 0.5,
+                            progress_callback: Optional[Callable[[int, int], None]] = None) -> Dict:
+        """Analyse plusieurs régions oculaires avec Gemma 3n
+        
+        progress_callback(done, total) est appelé après chaque région analysée
+        """
         if not self.is_ready():
             logger.warning("Gemma model not ready, using fallback analysis")
             return self._fallback_analysis(eye_regions)
@@ -238,6 +242,9 @@ class GemmaHandlerV2:
                 region_result = self._analyze_single_region(region, confidence_threshold)
                 region_result['region_id'] = i
                 results['results'].append(region_result)
+                
+                if progress_callback:
+                    progress_callback(i + 1, len(eye_regions))
             
             results['processing_time'] = time.time() - start_time
             logger.info(f"Analysis completed in {results['processing_time']:.2f}s")
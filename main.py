@@ -1047,7 +1047,7 @@ PATIENT INFORMATION:
                     if face_summary and 'error' not in face_summary:
                         report += f"\nTotal analyses: {face_summary.get('total_analyses', 0)}"
                         report += f"\nPositive analyses: {face_summary.get('positive_analyses', 0)}"
-                        report += f"\nFirst seen: {face_summary.get('first_seen', 'Unknown')[:10]}"
+                        report += f"\nFirst seen: {(face_summary.get('first_seen') or 'Unknown')[:10]}"
                         report += f"\nRecommendation: {face_summary.get('recommendation', 'Unknown')}"
                 except Exception as e:
                     logger.error(f"Error getting face summary: {e}")
@@ -1202,8 +1202,8 @@ PATIENT INFORMATION:
             history_report = f"""PATIENT HISTORY REPORT
 {'='*50}
 Patient ID: {face_summary.get('face_id', 'Unknown')}
-First seen: {face_summary.get('first_seen', 'Unknown')[:19]}
-Last seen: {face_summary.get('last_seen', 'Unknown')[:19]}
+First seen: {(face_summary.get('first_seen') or 'Unknown')[:19]}
+Last seen: {(face_summary.get('last_seen') or 'Unknown')[:19]}
 Total encounters: {face_summary.get('seen_count', 0)}
 
 ANALYSIS SUMMARY:
@@ -1800,7 +1800,7 @@ def main():
                 # Sauvegarder les données de suivi facial
                 if hasattr(app, 'face_handler') and app.face_handler:
                     try:
-                        app.face_handler.save_data()
+                        app.face_handler.cleanup()
                         print("💾 Données de suivi facial sauvegardées")
                     except Exception as e:
                         logger.error(f"Erreur sauvegarde données faciales: {e}")
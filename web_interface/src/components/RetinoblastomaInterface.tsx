@@ -1,5 +1,5 @@
 // Imports
-import React, { useState, useEffect, useCallback } from 'react';
+import React, { useState, useEffect, useCallback, useRef } from 'react';
 import { Button } from '@/components/ui/button';
 import { Progress } from '@/components/ui/progress';
 import { Card, CardContent, CardHeader, CardTitle } from '@/components/ui/card';
@@ -30,6 +30,7 @@ interface SystemStatus {
   ready: boolean;
   overall_progress: number;
   modules: Record<string, any>;
+  version?: number;
 }
 
 interface AnalysisResult {
@@ -77,31 +78,59 @@ export const RetinoblastomaInterface = () => {
     modules: {}
   });
   const [currentSessionId, setCurrentSessionId] = useState<string | null>(null);
+  // Version du dernier statut appliqué : un snapshot plus ancien est ignoré
+  const statusVersion = useRef(-1);
 
   // Effet pour la connexion WebSocket
   useEffect(() => {
   const connectWebSocket = () => {
     console.log('🔌 Connecting to WebSocket...');
     const ws = new WebSocket('ws://localhost:8001/ws/progress');
+    // Le serveur envoie le JSON en frames binaires (UTF-8)
+    ws.binaryType = 'arraybuffer';
+    const decoder = new TextDecoder();
+    
+    // N'applique un statut que s'il n'est pas plus ancien que le dernier reçu
+    // (la réponse de /api/status peut arriver après des frames WebSocket plus récentes)
+    const applyStatus = (status) => {
+      if (status?.version !== undefined) {
+        if (status.version < statusVersion.current) return false;
+        statusVersion.current = status.version;
+      }
+      setSystemStatus(status);
+      return true;
+    };
     
     ws.onopen = () => {
       console.log('✅ WebSocket connected to backend');
       setWsConnection(ws);
+      // Serveur éventuellement redémarré : ses versions repartent de zéro
+      statusVersion.current = -1;
+      
+      // Statut initial : le serveur ne l'envoie plus sur le WebSocket
+      fetch('http://localhost:8001/api/status')
+        .then(response => response.json())
+        .then(status => applyStatus(status))
+        .catch(error => console.error('❌ Status fetch failed:', error));
     };
     
-    ws.onmessage = (event) => {
-      const data = JSON.parse(event.data);
-      console.log('📨 WebSocket message received:', data);
-      
+    const handleMessage = (data) => {
       switch (data.type) {
+        case 'batch':
+          // Messages regroupés côté serveur : les appliquer dans l'ordre
+          data.events.forEach(handleMessage);
+          break;
+          
         case 'initialization_progress':
           console.log('🔄 Initialization progress:', data.status);
-          setSystemStatus(data.status);
-          setInitMessage(data.message || '');
+          if (applyStatus(data.status)) {
+            setInitMessage(data.message || '');
+          }
           break;
           
         case 'initialization_complete':
           console.log('✅ Initialization complete!');
+          statusVersion.current = Math.max(statusVersion.current, data.status?.version ?? -1);
           setSystemStatus(prev => ({
             ...prev,
             status: 'ready',
@@ -112,6 +141,7 @@ export const RetinoblastomaInterface = () => {
           
         case 'initialization_error':
           console.error('❌ Initialization error:', data.error);
+          statusVersion.current = Math.max(statusVersion.current, data.status?.version ?? -1);
           setSystemStatus(prev => ({
             ...prev,
             status: 'error',
@@ -121,7 +151,7 @@ export const RetinoblastomaInterface = () => {
           
         case 'status_update':
           console.log('📊 Status update:', data.status);
-          setSystemStatus(data.status);
+          applyStatus(data.status);
           break;
           
         case 'analysis_progress':
@@ -156,6 +186,13 @@ export const RetinoblastomaInterface = () => {
       }
     };
     
+    ws.onmessage = (event) => {
+      const raw = typeof event.data === 'string' ? event.data : decoder.decode(event.data);
+      const data = JSON.parse(raw);
+      console.log('📨 WebSocket message received:', data);
+      handleMessage(data);
+    };
+    
     ws.onclose = () => {
       console.log('❌ WebSocket disconnected');
       setWsConnection(null);